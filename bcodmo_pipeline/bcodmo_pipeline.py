@@ -1,18 +1,14 @@
-import csv
 import asyncio
-import psutil
+import functools
 import threading
 import io
-import json
 from contextlib import redirect_stderr
 import logging
 import os
-import sys
 import shutil
 import signal
 from datapackage_pipelines.manager import run_pipelines
 from datapackage_pipelines.manager.tasks import async_execute_pipeline
-from datapackage_pipelines.status import status_mgr
 from datapackage_pipelines import pipelines
 from datapackage_pipelines.utilities.execution_id import gen_execution_id
 import subprocess
@@ -21,7 +17,45 @@ import uuid
 import yaml
 import re
 
-import bcodmo_processors
+from .checkpoints import (
+    discard_checkpoints,
+    plan_checkpoints,
+    promote_checkpoints,
+)
+from .columnar import check_columnar_available, read_columnar, write_columnar
+from .compression import DEFAULT_COMPRESSION, check_codec, compress_results
+from .environments import get_environment
+from .janitor import Janitor, touch_cache_folder
+from .limits import LIMIT_CHECK_INTERVAL, LimitMonitor, get_limits
+from .memo import get_memo_key, restore_result, store_result
+from .metrics import (
+    COMPUTE_SECONDS,
+    QUEUE_WAIT_SECONDS,
+    READ_SECONDS,
+    RUN_SECONDS,
+    RUN_START_SECONDS,
+    RUNS,
+    SPAWN_SECONDS,
+    STATUS_SECONDS,
+    registry,
+)
+from .progress import instrument_steps, load_profile, load_progress, write_profile
+from .results import (
+    get_field_names,
+    get_index_path,
+    get_resource_files,
+    is_csv,
+    iter_rows,
+    load_datapackage,
+    read_rows,
+)
+from .runs import AsyncWake, cancel_run, find_run, register_run, unregister_run
+from .scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, scheduler
+from .spec_yaml import dump_header, dump_step, join_spec, load_yaml
+from .statuses import FINISHED_STATES, STATUS_CACHE_TTL, StatusBackend
+from .summaries import load_summary, write_summary
+from .validation import validate_steps
+from .worker_pool import worker_pool
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -30,9 +64,32 @@ logger = logging.getLogger(__name__)
 
 FILE_PATH = os.path.dirname(os.path.realpath(__file__))
 ROOT_DIR = f'{FILE_PATH}/tmp'
+CHECKPOINT_DIR = f'{ROOT_DIR}/.checkpoints'
+MEMO_DIR = f'{ROOT_DIR}/.memo'
+
+janitor = Janitor(ROOT_DIR, CHECKPOINT_DIR, MEMO_DIR)
+status_backend = StatusBackend(ROOT_DIR)
+
+# How often a running pipeline checks whether its pipeline-spec.yaml was deleted by another process
+SPEC_CHECK_INTERVAL = 1
+# Seconds the processes of a stopped run are given to exit before they are killed
+TERMINATE_TIMEOUT = 5
+# Bounds of the backoff used while waiting for dpp to register a background run
+START_CHECK_MIN_INTERVAL = 0.01
+START_CHECK_MAX_INTERVAL = 0.2
+# Number of pipelines of a batch that dpp runs at once, capped by the maximum number of runs of the scheduler
+BATCH_CONCURRENCY = int(os.environ.get('BCODMO_PIPELINE_BATCH_CONCURRENCY', 4))
+# Rows read per trip to the executor by aiter_pipeline_data when no batch_size is passed in
+ASYNC_READ_BATCH_SIZE = 1000
+
+# Runs supervised by an event loop, the loop itself only keeps weak references to them
+_async_tasks = set()
 
-# Day in seconds
-DAY = 60 * 60 * 24
+
+def _forget_async_task(task):
+    _async_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f'There was an error supervising a pipeline: {str(task.exception())}')
 
 class BcodmoPipeline:
     def __init__(self, *args, **kwargs):
@@ -55,11 +112,12 @@ class BcodmoPipeline:
                     A list of steps representing the pipeline
                     These steps will be validated using the constants.py file
         '''
-
-        # Attributes for virtualenv
-        self.prev_os_path = None
-        self.prev_sys_path = None
-        self.prev_prefix = None
+        # The dumped yaml of the header and of every step, so a spec is only dumped once.
+        # Steps are only ever appended through add_step, which clears the cached whole spec
+        self._header_yaml = None
+        self._header_key = None
+        self._step_yamls = []
+        self._yaml = None
 
         if 'pipeline_spec' in kwargs:
             self.name, self.title, \
@@ -96,26 +154,95 @@ class BcodmoPipeline:
 
     def add_step(self, obj):
         self._confirm_valid(obj)
+        errors = validate_steps(self.version, [obj], start=len(self._steps))
+        if errors:
+            raise Exception('\n'.join(errors))
         self._steps.append(obj)
+        self._yaml = None
 
     @staticmethod
     def delete_pipeline_data(cache_id):
         folder = f'{FILE_PATH}/tmp/{cache_id}'
         shutil.rmtree(folder)
+        # Stop a run of this cache_id right away rather than when its thread notices the deleted folder
+        cancel_run(cache_id)
         return {
             'status_code': 0,
         }
 
 
     @staticmethod
-    def get_pipeline_data(cache_id, num_rows=-1):
+    def cancel_pipeline(cache_id):
+        '''
+        Stop a run of this process right away
+
+        The dpp process of the run and every process it started are signalled at once
+        (they share a process group), the last execution is marked as failed in the
+        status backend and the slot of the run in the scheduler is freed for the next run.
+        A queued run is taken out of the queue. The cache folder is kept.
+
+        Cancelling a pipeline that was started with run_pipelines stops the dpp process of
+        its whole batch, the pipelines of the batch that already succeeded keep their results
+        '''
+        run = find_run(cache_id)
+        if run is None or run.finishing.is_set():
+            return {
+                'status_code': 1,
+                'cache_id': cache_id,
+                'error_text': f'There is no active run of {cache_id} in this process',
+            }
+        run.cancel()
+        if run.ticket is not None:
+            scheduler.release(run.ticket)
+        if run.process is not None:
+            BcodmoPipeline._signal_process_group(run.process, signal.SIGTERM)
+        # The supervising thread kills what is left once TERMINATE_TIMEOUT is over
+        for pipeline_id in run.pipeline_ids.values():
+            BcodmoPipeline._invalidate_execution(pipeline_id, 'This pipeline was cancelled', run.created)
+        return {
+            'status_code': 0,
+            'cache_id': cache_id,
+        }
+
+    @staticmethod
+    def clean_cache():
+        '''
+        Clean up the tmp folder now instead of waiting for the janitor's next sweep
+
+        Returns a report of the removed cache folders and the number of bytes reclaimed
+        '''
+        return janitor.sweep()
+
+    @staticmethod
+    def get_pipeline_data(cache_id, num_rows=-1, offset=0, resources=None, fields=None):
+        '''
+        Get the datapackage, yaml and a window of rows for the resources of a run
+
+        - num_rows is the maximum number of rows returned per resource, -1 returns every row
+        - offset is the number of rows to skip in each resource. Pages after the first
+          are served from a row offset index stored in tmp/<cache_id>/index, which is
+          built on first access and rebuilt whenever the result file changes
+        - resources is a collection of resource names. If it is passed in only
+          those resources are read, the other files are never opened
+        - fields is a list of field names (as found in the datapackage.json schema).
+          If it is passed in only those columns are returned, in that order
+        '''
         try:
             num_rows = int(num_rows)
         except ValueError:
             raise Exception(f'The passed in parameter num_rows "{num_rows}" was not able to be parsed into an integer')
+        try:
+            offset = int(offset)
+        except ValueError:
+            raise Exception(f'The passed in parameter offset "{offset}" was not able to be parsed into an integer')
+        if offset < 0:
+            raise Exception(f'The passed in parameter offset "{offset}" must not be negative')
+        if resources is not None:
+            resources = set(resources)
+        start = time.time()
         datapackage = {}
         yaml = None
-        resources = {}
+        resource_data = {}
 
         cache_folder = f'{FILE_PATH}/tmp/{cache_id}'
         pipeline_spec_file = f'{cache_folder}/pipeline-spec.yaml'
@@ -124,161 +251,644 @@ class BcodmoPipeline:
                 yaml = f.read()
 
         data_folder = f'{cache_folder}/results'
+        index_folder = f'{cache_folder}/index'
         if os.path.exists(data_folder):
-            datapackage_file = f'{data_folder}/datapackage.json'
-            if os.path.exists(datapackage_file):
-                with open(datapackage_file) as f:
-                    datapackage = json.load(f)
-            for root, dirs, files in os.walk(data_folder):
-                for fname in files:
-                    if fname == 'datapackage.json':
-                        continue
-                    resource_name, ext = os.path.splitext(fname)
-                    # TODO support json format?
-                    if ext != '.csv':
-                        raise Exception(f'Non csv formats are not supported: {fname}')
-                    data_file_path = os.path.join(root, fname)
-                    if os.path.exists(data_file_path):
-                        with open(data_file_path) as f:
-                            reader = csv.reader(f)
-                            header = next(reader)
-                            rows = []
-                            try:
-                                if num_rows >= 0:
-                                    for i in range(num_rows):
-                                        rows.append(next(reader))
-                                else:
-                                    while True:
-                                        row = next(reader)
-                                        rows.append(row)
-                            except StopIteration:
-                                pass
-                            resources[resource_name] = {
-                                'header': header,
-                                'rows': rows,
-                            }
+            touch_cache_folder(cache_folder)
+            datapackage = load_datapackage(data_folder)
+            resource_files = get_resource_files(data_folder, datapackage, resources)
+            for resource_name, (data_file_path, descriptor) in resource_files.items():
+                # TODO support json format?
+                if not is_csv(data_file_path):
+                    raise Exception(f'Non csv formats are not supported: {os.path.basename(data_file_path)}')
+                header, rows = read_rows(
+                    data_file_path,
+                    num_rows=num_rows,
+                    offset=offset,
+                    index_path=get_index_path(data_folder, index_folder, data_file_path),
+                    fields=fields,
+                    field_names=get_field_names(descriptor),
+                )
+                resource_data[resource_name] = {
+                    'header': header,
+                    'rows': rows,
+                }
 
+        READ_SECONDS.observe(time.time() - start, reader='get_pipeline_data')
         return {
             'cache_id': cache_id,
             'datapackage': datapackage,
             'yaml': yaml,
-            'resources': resources,
+            'resources': resource_data,
         }
 
     @staticmethod
-    def get_pipeline_status(cache_id, name):
-        status = status_mgr(f'{FILE_PATH}/tmp')
-        status.initialize()
-        pipeline_status = status.get(f'./{cache_id}/{name}')
-        start_time = None
-        finish_time = None
-        pipeline_id = None
-        status = None
-        success = None
-        error_log = None
-
-        if pipeline_status and pipeline_status.last_execution:
-            last_execution = pipeline_status.last_execution
-            start_time = last_execution.start_time
-            pipeline_id = last_execution.pipeline_id
-            finish_time = last_execution.finish_time
-            success = last_execution.success
-            error_log = last_execution.error_log
-            status = pipeline_status.state()
+    def iter_pipeline_data(cache_id, resource=None, offset=0, batch_size=None, fields=None):
+        '''
+        Lazily yield the header and then the rows of a single resource of a run
 
+        Unlike get_pipeline_data nothing is held in memory beyond the current row
+        (or batch), so the rows can be written straight to a response
+
+        - resource is the name of the resource to read. It can be left out
+          if the run only produced a single resource
+        - offset and fields work the same way as in get_pipeline_data
+        - batch_size, if set, yields lists of at most batch_size rows instead of single rows
+        '''
+        cache_folder = f'{FILE_PATH}/tmp/{cache_id}'
+        data_folder = f'{cache_folder}/results'
+        index_folder = f'{cache_folder}/index'
+        resource_files = {}
+        if os.path.exists(data_folder):
+            touch_cache_folder(cache_folder)
+            resource_files = get_resource_files(
+                data_folder,
+                load_datapackage(data_folder),
+                None if resource is None else {resource},
+            )
+        if resource is None and len(resource_files) != 1:
+            raise Exception(f'A resource must be specified, found {len(resource_files)} resources')
+        if not resource_files:
+            raise Exception(f'Resource "{resource}" was not found in the results of {cache_id}')
+        data_file_path, descriptor = list(resource_files.values())[0]
+        if not is_csv(data_file_path):
+            raise Exception(f'Non csv formats are not supported: {os.path.basename(data_file_path)}')
+        yield from iter_rows(
+            data_file_path,
+            offset=offset,
+            index_path=get_index_path(data_folder, index_folder, data_file_path),
+            batch_size=batch_size,
+            fields=fields,
+            field_names=get_field_names(descriptor),
+        )
+
+    @staticmethod
+    def get_pipeline_columns(cache_id, resources=None, fields=None):
+        '''
+        Get the columnar results of a run that was started with columnar=True
+
+        The Arrow IPC files are memory-mapped, so only the columns that are used
+        are read from disk and no text is parsed
+
+        - resources is a collection of resource names, only those are returned if it is passed in
+        - fields is a list of field names, only those columns are returned if it is passed in
+
+        Returns a pyarrow Table per resource. There are none until get_pipeline_status
+        reports the run as finished
+        '''
+        start = time.time()
+        cache_folder = f'{FILE_PATH}/tmp/{cache_id}'
+        touch_cache_folder(cache_folder)
+        if resources is not None:
+            resources = set(resources)
+        tables = read_columnar(f'{cache_folder}/columnar', resources, fields)
+        READ_SECONDS.observe(time.time() - start, reader='get_pipeline_columns')
         return {
-            'start_time': start_time,
-            'finish_time': finish_time,
-            'pipeline_id': pipeline_id,
-            'status': status,
-            'error_log': error_log,
-            'success': success,
+            'cache_id': cache_id,
+            'resources': tables,
+        }
+
+    @staticmethod
+    def get_pipeline_summary(cache_id):
+        '''
+        Get the summary of every resource of a finished run without reading the result files
+
+        The summaries are written once the run has dumped and compressed its results, before
+        get_pipeline_status reports it as finished. Each one has the row count, the byte size
+        of the file, its header and first rows, and the number of missing values, min and max
+        of every field. The resources are empty if the run didn't succeed or is still running
+        '''
+        start = time.time()
+        cache_folder = f'{FILE_PATH}/tmp/{cache_id}'
+        summary = load_summary(f'{cache_folder}/summary.json')
+        if summary is not None:
+            touch_cache_folder(cache_folder)
+        READ_SECONDS.observe(time.time() - start, reader='get_pipeline_summary')
+        return {
+            'cache_id': cache_id,
+            'resources': summary or {},
+        }
+
+    @staticmethod
+    def get_pipeline_progress(cache_id):
+        '''
+        Get the live progress of a run that was started with progress=True
+
+        Only the small progress files written by the run are read, so this is cheap
+        enough to poll while the run is going
+
+        - steps has the number of rows that came out of every step of the pipeline that
+          has started, per resource, and whether the step has gone through all of its rows.
+          The steps restored from a checkpoint don't run, so they have no progress
+        - current_step is the index of the first step that hasn't gone through all of
+          its rows, None if no step has started yet or if all of them are done
+        - rows is the number of rows per resource that made it through the run so far
+        '''
+        cache_folder = f'{FILE_PATH}/tmp/{cache_id}'
+        steps, current_step = load_progress(f'{cache_folder}/progress')
+        return {
+            'cache_id': cache_id,
+            'steps': [step for step in steps if not step['injected']],
+            'current_step': current_step,
+            'rows': steps[-1]['rows'] if steps else {},
         }
 
+    @staticmethod
+    def get_pipeline_status(cache_id, name):
+        return BcodmoPipeline.get_pipeline_statuses([(cache_id, name)], ttl=0)[cache_id]
+
+    @staticmethod
+    def get_pipeline_statuses(pipelines, ttl=None):
+        '''
+        Get the status of many runs at once
+
+        - pipelines is a list of (cache_id, name) pairs
+        - ttl is the number of seconds a status read by an earlier call is reused for,
+          STATUS_CACHE_TTL by default. 0 always reads the status backend
+
+        The status backend is only initialized once per process and read in a single
+        pass for all of the runs. Returns a dictionary of the statuses by cache_id, with
+        the same fields as get_pipeline_status
+
+        dpp marks a run as over before its results are compressed, summarized and stored.
+        Until that is done a run of this process is reported as RUNNING, and finished is
+        only True once the results can be read
+        '''
+        lookup_start = time.time()
+        if ttl is None:
+            ttl = STATUS_CACHE_TTL
+        pipeline_ids = {cache_id: f'./{cache_id}/{name}' for cache_id, name in pipelines}
+        statuses = status_backend.read(pipeline_ids.values(), ttl=ttl)
+
+        results = {}
+        for cache_id, pipeline_id in pipeline_ids.items():
+            result = statuses[pipeline_id]
+            # Runs waiting in the scheduler of this process haven't reached dpp yet
+            result['queue_position'] = scheduler.position(cache_id)
+            if result['queue_position'] is not None:
+                result['status'] = 'QUEUED'
+            run = find_run(cache_id)
+            if run is not None and not run.finished.is_set() and result['status'] in FINISHED_STATES:
+                result['status'] = 'RUNNING'
+                result['success'] = None
+                result['error_log'] = None
+            result['finished'] = result['status'] in FINISHED_STATES
+            result['profile'] = load_profile(f'{FILE_PATH}/tmp/{cache_id}/profile.json')
+            results[cache_id] = result
+
+        STATUS_SECONDS.observe(time.time() - lookup_start)
+        return results
+
+    @staticmethod
+    async def aget_pipeline_status(cache_id, name):
+        '''
+        The asyncio counterpart of get_pipeline_status, the status backend is read in the default executor
+        '''
+        return await asyncio.get_event_loop().run_in_executor(
+            None,
+            BcodmoPipeline.get_pipeline_status,
+            cache_id,
+            name,
+        )
+
+    @staticmethod
+    async def aget_pipeline_data(cache_id, num_rows=-1, offset=0, resources=None, fields=None):
+        '''
+        The asyncio counterpart of get_pipeline_data, the files are read in the default executor
+        '''
+        return await asyncio.get_event_loop().run_in_executor(None, functools.partial(
+            BcodmoPipeline.get_pipeline_data,
+            cache_id,
+            num_rows=num_rows,
+            offset=offset,
+            resources=resources,
+            fields=fields,
+        ))
+
+    @staticmethod
+    async def aiter_pipeline_data(cache_id, resource=None, offset=0, batch_size=None, fields=None):
+        '''
+        The asyncio counterpart of iter_pipeline_data, an async generator of the header
+        and then the rows (or batches of rows) of a single resource
+
+        The rows are read in the default executor ASYNC_READ_BATCH_SIZE at a time
+        (or batch_size at a time if it is passed in), so the loop is never blocked on the file
+        '''
+        loop = asyncio.get_event_loop()
+        rows = BcodmoPipeline.iter_pipeline_data(
+            cache_id,
+            resource=resource,
+            offset=offset,
+            batch_size=batch_size or ASYNC_READ_BATCH_SIZE,
+            fields=fields,
+        )
+        try:
+            # next is passed a default, a StopIteration can't go through a future
+            header = await loop.run_in_executor(None, next, rows, None)
+            if header is None:
+                return
+            yield header
+            while True:
+                batch = await loop.run_in_executor(None, next, rows, None)
+                if batch is None:
+                    break
+                if batch_size:
+                    yield batch
+                else:
+                    for row in batch:
+                        yield row
+        finally:
+            rows.close()
+
+    @staticmethod
+    def get_metrics(format='json'):
+        '''
+        Get the metrics collected in this process since it started
+
+        - format is either 'json', which returns a dictionary with the p50, p90 and p99
+          of every latency histogram, or 'prometheus', which returns the Prometheus
+          text exposition format
+        '''
+        if format == 'json':
+            return registry.snapshot()
+        if format == 'prometheus':
+            return registry.to_prometheus()
+        raise Exception(f'Unknown metrics format "{format}", must be one of [\'json\', \'prometheus\']')
+
     @staticmethod
     def log_slow_compute(start, cache_id, text):
         elapsed = time.time() - start
+        COMPUTE_SECONDS.observe(elapsed, phase=text)
         if elapsed > 0.1:
             logging.error(f'Slow compute while {text}: {elapsed} - {cache_id}')
 
-    def run_pipeline_thread(self, cache_id, verbose):
+    def run_pipeline_thread(self, cache_id, verbose, pending_checkpoints=None, memo_key=None, run=None, compression=None, columnar=False, profile=False):
         cache_dir = f'{ROOT_DIR}/{cache_id}'
         pipeline_spec_path = f'{cache_dir}/pipeline-spec.yaml'
         pipeline_id = f'./{cache_id}/{self.name}'
+        if run is None:
+            run = register_run(cache_id, pipeline_ids={cache_id: pipeline_id})
+        stopped = False
 
-        dpp_command_path, processor_path = self._get_version_paths(self.version)
-        os.environ['DPP_PROCESSOR_PATH'] = processor_path
         try:
-            # Activate the correct virtual environment
-            start = time.time()
-            self._activate_virtualenv(self.version)
-            BcodmoPipeline.log_slow_compute(start, cache_id, 'activating the virtualenv')
+            if self._wait_for_slot(run, [pipeline_spec_path]):
+                environment = get_environment(self.version)
+                stopped = self._supervise_process(
+                    run,
+                    environment,
+                    self._get_command_list(environment, pipeline_id, verbose),
+                    [pipeline_id],
+                    [pipeline_spec_path],
+                )
+            else:
+                stopped = True
+            self._release_slot(run)
+            self._finish_run(cache_id, stopped, pending_checkpoints, memo_key, compression, columnar, profile)
+        finally:
+            self._release_run(run)
+
+    async def _arun_pipeline_task(self, cache_id, verbose, pending_checkpoints, memo_key, run, compression, columnar, profile):
+        '''
+        The event loop counterpart of run_pipeline_thread
+        '''
+        cache_dir = f'{ROOT_DIR}/{cache_id}'
+        pipeline_spec_path = f'{cache_dir}/pipeline-spec.yaml'
+        pipeline_id = f'./{cache_id}/{self.name}'
+        stopped = False
 
-            # Set the verbose string if necessary
-            if verbose:
-                command_list = [dpp_command_path, 'run', '--verbose', pipeline_id]
+        try:
+            if await self._await_slot(run, [pipeline_spec_path]):
+                environment = get_environment(self.version)
+                stopped = await self._asupervise_process(
+                    run,
+                    environment,
+                    self._get_command_list(environment, pipeline_id, verbose),
+                    [pipeline_id],
+                    [pipeline_spec_path],
+                )
             else:
-                command_list = [dpp_command_path, 'run', pipeline_id]
+                stopped = True
+            self._release_slot(run)
+            await asyncio.get_event_loop().run_in_executor(None, functools.partial(
+                self._finish_run,
+                cache_id,
+                stopped,
+                pending_checkpoints,
+                memo_key,
+                compression,
+                columnar,
+                profile,
+            ))
+        finally:
+            self._release_run(run)
+
+    @staticmethod
+    def _get_command_list(environment, pipeline_id, verbose):
+        # Set the verbose string if necessary
+        if verbose:
+            return [environment.dpp_command_path, 'run', '--verbose', pipeline_id]
+        return [environment.dpp_command_path, 'run', pipeline_id]
+
+    @staticmethod
+    def _release_slot(run):
+        '''
+        Free the slot of a run whose dpp process is over for the next run
+
+        The run stays registered until _finish_run is done with its results, so
+        get_pipeline_statuses doesn't report it as over before they are ready
+        '''
+        if run.ticket is not None:
+            scheduler.release(run.ticket)
+        run.finishing.set()
+
+    @staticmethod
+    def _release_run(run):
+        if run.ticket is not None:
+            scheduler.release(run.ticket)
+        unregister_run(run)
+        run.finish()
+
+    def _finish_run(self, cache_id, stopped, pending_checkpoints, memo_key, compression, columnar, profile):
+        '''
+        Store or clean up what a run left behind once its dpp process is over
+        '''
+        cache_dir = f'{ROOT_DIR}/{cache_id}'
+        pipeline_spec_path = f'{cache_dir}/pipeline-spec.yaml'
+        summary_path = f'{cache_dir}/summary.json'
+        pipeline_id = f'./{cache_id}/{self.name}'
+        status_backend.invalidate(pipeline_id)
+
+        # If the pipeline-spec.yaml file has been deleted since this thread started, the
+        # whole cache_id folder should be deleted
+        if not os.path.exists(pipeline_spec_path):
+            RUNS.inc(result='stopped')
+            discard_checkpoints(pending_checkpoints or [])
+            if os.path.exists(cache_dir):
+                shutil.rmtree(cache_dir)
+        elif stopped:
+            RUNS.inc(result='stopped')
+            discard_checkpoints(pending_checkpoints or [])
+        else:
+            if profile:
+                start = time.time()
+                write_profile(f'{cache_dir}/progress', f'{cache_dir}/profile.json')
+                BcodmoPipeline.log_slow_compute(start, cache_id, 'writing the profile')
 
-            # Start the dpp process
             start = time.time()
+            promote_checkpoints(pending_checkpoints or [])
+            BcodmoPipeline.log_slow_compute(start, cache_id, 'storing the checkpoints')
+
+            # The status of the run is held back by get_pipeline_statuses until this is done
+            success = status_backend.read([pipeline_id])[pipeline_id]['success']
+            RUNS.inc(result='success' if success else 'failure')
+            if success:
+                results_folder = f'{cache_dir}/results'
+                if columnar:
+                    start = time.time()
+                    write_columnar(results_folder, f'{cache_dir}/columnar')
+                    BcodmoPipeline.log_slow_compute(start, cache_id, 'writing the columnar results')
+                if compression is not None:
+                    start = time.time()
+                    compress_results(results_folder, compression)
+                    BcodmoPipeline.log_slow_compute(start, cache_id, 'compressing the results')
+                start = time.time()
+                write_summary(results_folder, summary_path)
+                BcodmoPipeline.log_slow_compute(start, cache_id, 'summarizing the results')
+                if memo_key:
+                    start = time.time()
+                    store_result(MEMO_DIR, memo_key, results_folder, summary_path)
+                    BcodmoPipeline.log_slow_compute(start, cache_id, 'storing the memoized results')
+
+    @staticmethod
+    def _specs_exist(pipeline_spec_paths):
+        '''
+        Whether any of the pipeline-spec.yaml files of a run is still there
+        '''
+        return any(os.path.exists(path) for path in pipeline_spec_paths)
+
+    @staticmethod
+    def _wait_for_slot(run, pipeline_spec_paths):
+        '''
+        Wait until the scheduler lets the run start
+
+        Returns False if the run was cancelled or all of its pipeline-spec.yaml files deleted while it was queued
+        '''
+        if run.ticket is None:
+            return True
+        start = time.time()
+        # Both the admission and a cancellation set wake
+        while not run.ticket.admitted.is_set():
+            run.wake.wait(SPEC_CHECK_INTERVAL)
+            if run.cancelled.is_set() or not BcodmoPipeline._specs_exist(pipeline_spec_paths):
+                return False
+        QUEUE_WAIT_SECONDS.observe(time.time() - start)
+        run.wake.clear()
+        return not run.cancelled.is_set()
+
+    @staticmethod
+    async def _await_slot(run, pipeline_spec_paths):
+        '''
+        The event loop counterpart of _wait_for_slot
+        '''
+        if run.ticket is None:
+            return True
+        start = time.time()
+        while not run.ticket.admitted.is_set():
+            await run.wake.wait(SPEC_CHECK_INTERVAL)
+            run.wake.clear()
+            if run.cancelled.is_set() or not BcodmoPipeline._specs_exist(pipeline_spec_paths):
+                return False
+        QUEUE_WAIT_SECONDS.observe(time.time() - start)
+        run.wake.clear()
+        return not run.cancelled.is_set()
+
+    @staticmethod
+    def _supervise_process(run, environment, command_list, pipeline_ids, pipeline_spec_paths):
+        '''
+        Start the dpp process and wait for it to exit, stopping it if the run is cancelled
+
+        A batch runs several pipelines in one process, which is only stopped once all
+        of their pipeline-spec.yaml files are deleted. The process runs in the environment
+        of the version, the host's environment is left untouched. If the worker pool is
+        enabled the process is forked from a warm worker of the version, falling back to
+        a new dpp process if that fails. The process is stopped as well if it goes over
+        the limits of the run
+
+        Returns True if the process was stopped
+        '''
+        cache_id = run.cache_id
+        monitor = LimitMonitor(run.limits or get_limits(), cache_id)
+        interval = LIMIT_CHECK_INTERVAL if monitor.active else SPEC_CHECK_INTERVAL
+
+        # Start the dpp process
+        start = time.time()
+        p = None
+        spawn_method = 'worker'
+        if worker_pool.enabled:
+            try:
+                p = worker_pool.spawn(environment.python_path, environment.env, command_list[1:], ROOT_DIR)
+            except Exception as e:
+                logger.error(f'Could not start the pipeline in a warm worker, starting dpp instead: {str(e)}')
+        if p is None:
+            spawn_method = 'dpp'
+            # dpp leads a process group of its own, so the whole tree can be signalled at once
             p = subprocess.Popen(
                 command_list,
                 stderr=subprocess.DEVNULL,
                 stdout=subprocess.DEVNULL,
                 cwd=ROOT_DIR,
+                env=environment.env,
+                start_new_session=True,
             )
-            BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the process')
+        BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the process')
+        spawned = time.time()
+        SPAWN_SECONDS.observe(spawned - start, method=spawn_method)
+        RUN_START_SECONDS.observe(spawned - run.created)
+        # The process must be set before started, waiters take a run without one as failing to start
+        monitor.attach(p.pid)
+        run.watch(p)
+        run.started.set()
+
+        # The run is woken up as soon as the process exits or the run is cancelled.
+        # The wait only times out to notice a pipeline-spec.yaml deleted by another process,
+        # and to check the limits of the run
+        limit_error = None
+        while not run.wake.wait(interval) and BcodmoPipeline._specs_exist(pipeline_spec_paths):
+            limit_error = monitor.check()
+            if limit_error is not None:
+                logger.error(f'Stopping the pipeline, {limit_error} - {cache_id}')
+                break
+        RUN_SECONDS.observe(time.time() - spawned)
+
+        if p.poll() is not None and limit_error is None:
+            limit_error = monitor.check_exit()
+            if limit_error is None:
+                monitor.close()
+                return False
+
+        # The run was cancelled or the pipeline-spec.yaml was deleted, need to end the process now
+        BcodmoPipeline._signal_process_group(p, signal.SIGTERM)
+        try:
+            p.wait(TERMINATE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            pass
+        # Kill whatever is left of the tree, even if dpp itself has exited
+        BcodmoPipeline._signal_process_group(p, signal.SIGKILL)
+        p.wait()
+        monitor.close()
+        # A run that went over a limit before dpp registered it still gets a failed execution
+        for pipeline_id in pipeline_ids:
+            BcodmoPipeline._invalidate_execution(pipeline_id, limit_error, run.created)
+        return True
 
-            sleep_timer = 1
-            start = time.time()
-            while p.poll() is None:
-                BcodmoPipeline.log_slow_compute(start, cache_id, 'polling the process')
-                time.sleep(1)
-                if sleep_timer != 5:
-                    sleep_timer += 1
-
-                # The pipeline-spec.yaml was deleted, need to end the process now
-                if not os.path.exists(pipeline_spec_path):
-                    # Get the chilren of the dpp process (the dpp slave process)
-                    children = [child.pid for child in psutil.Process(p.pid).children()]
-
-                    # Terminate the parent process
-                    p.terminate()
-                    # Terminate all of the children processes
-                    for child in children:
-                        os.kill(child, signal.SIGTERM)
-
-                    # Invalidate the pipeline in the dpp backend
-                    status = status_mgr(ROOT_DIR)
-                    status.initialize()
-                    pipeline_status = status.get(pipeline_id)
-                    if pipeline_status:
-                        last_execution = pipeline_status.last_execution
-                        if last_execution:
-                            last_execution.finish_execution(
-                                False,
-                                {},
-                                ['This pipeline was stopped by laminar'],
-                            )
-
-                    # One last try
-                    if p.poll() is None:
-                        p.kill()
-                        break
-                start = time.time()
-        finally:
-            # Deactivate the virtualenv - not sure if this is necessary since it is a thread
-            start = time.time()
-            self._deactivate_virtualenv()
-            BcodmoPipeline.log_slow_compute(start, cache_id, 'deactivating the virtualenv')
+    @staticmethod
+    async def _asupervise_process(run, environment, command_list, pipeline_ids, pipeline_spec_paths):
+        '''
+        The event loop counterpart of _supervise_process
 
-        # If the pipeline-spec.yaml file has been deleted since this thread started, the
-        # whole cache_id folder should be deleted
-        if not os.path.exists(pipeline_spec_path) and os.path.exists(cache_dir):
-            shutil.rmtree(cache_dir)
+        dpp is started as an asyncio subprocess, so the loop is told when it exits
+        and no thread is tied up while it runs. Warm workers are not used here,
+        handing a job to one blocks until it is forked
+        '''
+        cache_id = run.cache_id
+        loop = asyncio.get_event_loop()
+        monitor = LimitMonitor(run.limits or get_limits(), cache_id)
+        interval = LIMIT_CHECK_INTERVAL if monitor.active else SPEC_CHECK_INTERVAL
+
+        start = time.time()
+        p = await asyncio.create_subprocess_exec(
+            *command_list,
+            stderr=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            cwd=ROOT_DIR,
+            env=environment.env,
+            start_new_session=True,
+        )
+        BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the process')
+        spawned = time.time()
+        SPAWN_SECONDS.observe(spawned - start, method='asyncio')
+        RUN_START_SECONDS.observe(spawned - run.created)
+        run.process = p
+        run.started.set()
+
+        monitor.attach(p.pid)
+        exited = asyncio.ensure_future(p.wait())
+        exited.add_done_callback(lambda _: run.wake.set())
+        limit_error = None
+        while not exited.done() and not run.cancelled.is_set() and BcodmoPipeline._specs_exist(pipeline_spec_paths):
+            await run.wake.wait(interval)
+            run.wake.clear()
+            if not exited.done():
+                limit_error = monitor.check()
+                if limit_error is not None:
+                    logger.error(f'Stopping the pipeline, {limit_error} - {cache_id}')
+                    break
+        RUN_SECONDS.observe(time.time() - spawned)
+
+        if p.returncode is not None and limit_error is None:
+            limit_error = monitor.check_exit()
+            if limit_error is None:
+                monitor.close()
+                return False
+
+        BcodmoPipeline._signal_process_group(p, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.shield(exited), TERMINATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        BcodmoPipeline._signal_process_group(p, signal.SIGKILL)
+        # Reap the process
+        await exited
+        monitor.close()
+        for pipeline_id in pipeline_ids:
+            await loop.run_in_executor(None, BcodmoPipeline._invalidate_execution, pipeline_id, limit_error, run.created)
+        return True
 
-    def run_pipeline(self, cache_id=None, verbose=False, num_rows=-1, background=False):
+    @staticmethod
+    def _signal_process_group(p, sig):
+        '''
+        Send a signal to the dpp process of a run and to every process it started
+
+        dpp is started as the leader of a process group of its own (a warm worker
+        starts it in a new session), and its children and their children stay in it.
+        The group is still signalled once dpp itself has exited
+        '''
+        if p.pid is None:
+            return
+        try:
+            os.killpg(p.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    @staticmethod
+    def _invalidate_execution(pipeline_id, error=None, since=None):
+        '''
+        Mark the last execution of a stopped pipeline as failed in the dpp backend,
+        unless it is already over
+
+        since is when the run that was stopped was created. If error is passed in and
+        dpp didn't queue an execution of the pipeline since then (the run was stopped
+        before dpp got to it), a failed execution is recorded with error, so the
+        status doesn't show an earlier execution or nothing at all
+        '''
+        status_backend.invalidate(pipeline_id)
+        pipeline_status = status_backend.get(pipeline_id)
+        if not pipeline_status:
+            return
+        last_execution = pipeline_status.last_execution
+        if last_execution and (since is None or (last_execution.queue_time or 0) >= since):
+            if last_execution.finish_time is None:
+                # dpp can only finish an execution that has started
+                if last_execution.start_time is None:
+                    last_execution.start_execution()
+                last_execution.finish_execution(
+                    False,
+                    {},
+                    [error or 'This pipeline was stopped by laminar'],
+                )
+        elif since is not None and error is not None:
+            BcodmoPipeline._record_execution(pipeline_id, False, [error])
+
+    def run_pipeline(self, cache_id=None, verbose=False, num_rows=-1, background=False, use_checkpoints=False, force=False, priority=None, compression=DEFAULT_COMPRESSION, columnar=False, progress=False, profile=False, validate=True, limits=None):
         '''
         Starts a thread that runs the datapackage pipelines for this pipeline
 
@@ -291,6 +901,327 @@ class BcodmoPipeline:
 
         - if run in the background use the static functions get_pipeline_status and
           get_pipeline_data to access the results.
+
+        - if use_checkpoints is True the datapackage is stored after the last step
+          in tmp/.checkpoints, and a later run whose first steps match a stored
+          checkpoint starts from it instead of from the load step. The steps after a
+          restored checkpoint receive the rows cast and the schema rewritten by
+          dump_to_path, which is why checkpoints are off by default.
+
+        - the results of successful runs are stored in tmp/.memo, keyed by the steps,
+          the version, the local input files and the compression. A run with the same key
+          links the stored results into its cache folder instead of running dpp, unless force is True.
+          force also skips restoring checkpoints, so every step is run again.
+          Runs that load remote urls are never memoized.
+
+        - runs wait in a queue when too many dpp processes are already running. Lower
+          priorities run first, by default interactive runs go ahead of background runs.
+          A run submitted while the queue is full fails right away.
+
+        - compression is the codec ('gzip' or 'zstd') the result files are compressed with
+          once the run succeeds, None keeps plain csv files. The results are decompressed
+          transparently by get_pipeline_data and iter_pipeline_data.
+
+        - if columnar is True every resource is also written as a typed Arrow IPC file
+          once the run succeeds, see get_pipeline_columns. This requires pyarrow.
+
+        - a summary of every resource is written once the run succeeds, see get_pipeline_summary.
+
+        - if progress is True a step counting the rows is inserted after every step,
+          see get_pipeline_progress. Every inserted step is an extra process the rows
+          go through, so it slows the run down.
+
+        - if profile is True the same steps are inserted, and once the run is over the wall time,
+          rows in, rows out and rows per second of every step are stored in
+          tmp/<cache_id>/profile.json. The profile is returned by get_pipeline_status.
+          The steps restored from a checkpoint and the steps added to the run are marked in it.
+
+        - arun_pipeline is the asyncio counterpart of this method
+
+        - if validate is True every step is checked against the processors of the version
+          before anything is run: unknown processor names, and parameters that don't match
+          the schema a processor ships. All of the errors are returned at once as error_text.
+
+        - limits caps the resident memory, CPU time and wall-clock time of the run, as a RunLimits
+          or a dictionary with some of its fields (memory in bytes, cpu_time and wall_time in seconds).
+          The limits left out come from the BCODMO_PIPELINE_RUN_MAX_MEMORY,
+          BCODMO_PIPELINE_RUN_MAX_CPU_TIME and BCODMO_PIPELINE_RUN_TIMEOUT environment variables.
+          A run that goes over one of them is killed, with an error such as
+          "killed: exceeded memory limit" in its error log.
+        '''
+        limits = get_limits(limits)
+        result, plan = self._prepare_run(cache_id, num_rows, background, use_checkpoints, force, compression, columnar, progress, profile, validate)
+        if result is not None:
+            return result
+        cache_id = plan['cache_id']
+
+        run, result = self._submit_run(cache_id, priority, background, limits)
+        if result is not None:
+            return result
+
+        start = time.time()
+        x = threading.Thread(target=self.run_pipeline_thread, args=(cache_id, verbose, plan['pending_checkpoints'], plan['memo_key'], run, compression, columnar, profile,), daemon=True)
+        BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the thread')
+        start = time.time()
+        x.start()
+        BcodmoPipeline.log_slow_compute(start, cache_id, 'starting the thread')
+
+        if background:
+            if not run.ticket.admitted.is_set():
+                return self._get_queued_result(cache_id)
+
+            # Wait for the thread to spawn dpp, then for dpp to register the new execution.
+            # The status handle from _prepare_run is reused and the backend is read with a
+            # backoff, returning early if the thread ends without starting the pipeline
+            run.started.wait()
+            delay = START_CHECK_MIN_INTERVAL
+            while True:
+                start = time.time()
+                pipeline_status = plan['status'].get(plan['pipeline_id'])
+                last_execution = pipeline_status.last_execution
+                BcodmoPipeline.log_slow_compute(start, cache_id, 'checking the status after creating the thread')
+                if last_execution and last_execution.start_time != plan['old_start_time']:
+                    break
+                if run.finished.is_set():
+                    return self._get_start_error_result(cache_id)
+                run.finished.wait(delay)
+                delay = min(delay * 2, START_CHECK_MAX_INTERVAL)
+
+            return {
+                'status_code': 0,
+                'cache_id': cache_id,
+                'yaml': self.get_yaml(),
+            }
+
+        else:
+            # Join the thread
+            x.join()
+            return self._get_run_result(cache_id, num_rows)
+
+    async def arun_pipeline(self, cache_id=None, verbose=False, num_rows=-1, background=False, use_checkpoints=False, force=False, priority=None, compression=DEFAULT_COMPRESSION, columnar=False, progress=False, profile=False, validate=True, limits=None):
+        '''
+        The asyncio counterpart of run_pipeline, with the same parameters and results
+
+        dpp is supervised by the running event loop instead of a thread, and the file
+        and status backend work is done in the default executor of the loop, so a single
+        loop can supervise many runs without blocking. With background=True the
+        coroutine returns once dpp has registered the run, which keeps going in a task
+        of the loop.
+
+        On python < 3.8 asyncio can only watch subprocesses from the loop of the main thread
+        '''
+        limits = get_limits(limits)
+        loop = asyncio.get_event_loop()
+        result, plan = await loop.run_in_executor(None, functools.partial(
+            self._prepare_run,
+            cache_id,
+            num_rows,
+            background,
+            use_checkpoints,
+            force,
+            compression,
+            columnar,
+            progress,
+            profile,
+            validate,
+        ))
+        if result is not None:
+            return result
+        cache_id = plan['cache_id']
+
+        run, result = self._submit_run(cache_id, priority, background, limits, wake=AsyncWake())
+        if result is not None:
+            return result
+
+        task = asyncio.ensure_future(self._arun_pipeline_task(
+            cache_id,
+            verbose,
+            plan['pending_checkpoints'],
+            plan['memo_key'],
+            run,
+            compression,
+            columnar,
+            profile,
+        ))
+        # The loop only keeps a weak reference to its tasks
+        _async_tasks.add(task)
+        task.add_done_callback(_forget_async_task)
+
+        if background:
+            if not run.ticket.admitted.is_set():
+                return self._get_queued_result(cache_id)
+
+            delay = START_CHECK_MIN_INTERVAL
+            while True:
+                if run.started.is_set():
+                    pipeline_status = await loop.run_in_executor(None, plan['status'].get, plan['pipeline_id'])
+                    last_execution = pipeline_status.last_execution
+                    if last_execution and last_execution.start_time != plan['old_start_time']:
+                        break
+                if task.done():
+                    return self._get_start_error_result(cache_id)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, START_CHECK_MAX_INTERVAL)
+
+            return {
+                'status_code': 0,
+                'cache_id': cache_id,
+                'yaml': self.get_yaml(),
+            }
+
+        await asyncio.shield(task)
+        return await loop.run_in_executor(None, self._get_run_result, cache_id, num_rows)
+
+    @staticmethod
+    def run_pipelines(pipelines, cache_ids=None, verbose=False, background=False, concurrency=None, use_checkpoints=False, force=False, priority=None, compression=DEFAULT_COMPRESSION, columnar=False, progress=False, profile=False, validate=True, limits=None):
+        '''
+        Run many pipelines through a single dpp process per processor version
+
+        Every pipeline gets its own cache folder, as with run_pipeline, and the pipelines
+        of a version are passed to one `dpp run --concurrency` as a comma separated list,
+        so dpp only starts up and reads the status backend once for all of them
+
+        - pipelines is a list of BcodmoPipeline objects
+        - cache_ids is an optional list of cache ids, one per pipeline
+        - concurrency is the number of pipelines dpp runs at once, BATCH_CONCURRENCY by default.
+          Each dpp process holds a single slot of the scheduler, so it is capped by the
+          maximum number of runs of the scheduler
+        - the other parameters are the same as those of run_pipeline, and apply to every pipeline.
+          The limits apply to the dpp process of a version as a whole
+
+        A pipeline whose pipeline-spec.yaml is deleted while the batch is running is cleaned
+        up once the batch is over, the dpp process is only stopped once every pipeline was deleted.
+
+        Returns a status code, 0 if every pipeline succeeded (or was started if background is True),
+        and the result of every pipeline in the order they were passed in, without the data.
+        Use get_pipeline_data to read the results. With background=True a pipeline keeps the
+        status of its last run until dpp gets to it
+        '''
+        if cache_ids is None:
+            cache_ids = [None] * len(pipelines)
+        if len(cache_ids) != len(pipelines):
+            raise Exception(f'{len(cache_ids)} cache ids were passed in for {len(pipelines)} pipelines')
+        if concurrency is None:
+            concurrency = BATCH_CONCURRENCY
+        concurrency = max(1, min(int(concurrency), scheduler.max_runs))
+        limits = get_limits(limits)
+
+        results = [None] * len(pipelines)
+        batches = {}
+        for i, (pipeline, cache_id) in enumerate(zip(pipelines, cache_ids)):
+            # Memoized results are restored without being waited on
+            result, plan = pipeline._prepare_run(cache_id, 0, True, use_checkpoints, force, compression, columnar, progress, profile, validate)
+            if result is not None:
+                results[i] = result
+            else:
+                batches.setdefault(pipeline.version, []).append((i, pipeline, plan))
+
+        if priority is None:
+            priority = PRIORITY_BACKGROUND if background else PRIORITY_INTERACTIVE
+        threads = []
+        for version, batch in batches.items():
+            # The run of a batch is registered under its own id, the cache ids of its pipelines stay free
+            run = register_run(str(uuid.uuid1()), pipeline_ids={plan['cache_id']: plan['pipeline_id'] for _, _, plan in batch})
+            run.limits = limits
+            run.ticket = scheduler.submit(run.cache_id, version, priority, wake=run.wake)
+            if run.ticket is None:
+                unregister_run(run)
+                for i, pipeline, plan in batch:
+                    RUNS.inc(result='rejected')
+                    results[i] = {
+                        'status_code': 1,
+                        'cache_id': plan['cache_id'],
+                        'yaml': pipeline.get_yaml(),
+                        'error_text': 'Too many pipelines are queued, try again later',
+                    }
+                continue
+            x = threading.Thread(target=BcodmoPipeline._run_batch_thread, args=(run, version, batch, verbose, concurrency, compression, columnar, profile,), daemon=True)
+            x.start()
+            threads.append((x, run, batch))
+
+        for x, run, batch in threads:
+            if background:
+                queue_position = None
+                if run.ticket.admitted.is_set():
+                    run.started.wait()
+                else:
+                    queue_position = scheduler.position(run.cache_id)
+                for i, pipeline, plan in batch:
+                    if run.ticket.admitted.is_set() and run.process is None:
+                        results[i] = pipeline._get_start_error_result(plan['cache_id'])
+                    else:
+                        results[i] = {
+                            'status_code': 0,
+                            'cache_id': plan['cache_id'],
+                            'yaml': pipeline.get_yaml(),
+                        }
+                        if queue_position is not None:
+                            results[i]['queue_position'] = queue_position
+            else:
+                x.join()
+                statuses = BcodmoPipeline.get_pipeline_statuses(
+                    [(plan['cache_id'], pipeline.name) for _, pipeline, plan in batch],
+                    ttl=0,
+                )
+                for i, pipeline, plan in batch:
+                    status_dict = statuses[plan['cache_id']]
+                    results[i] = {
+                        'status_code': 0 if status_dict['success'] else 1,
+                        'cache_id': plan['cache_id'],
+                        'yaml': pipeline.get_yaml(),
+                    }
+                    if not status_dict['success']:
+                        results[i]['error_text'] = status_dict['error_log']
+
+        return {
+            'status_code': 0 if all(result['status_code'] == 0 for result in results) else 1,
+            'pipelines': results,
+        }
+
+    @staticmethod
+    def _run_batch_thread(run, version, batch, verbose, concurrency, compression, columnar, profile):
+        '''
+        The run_pipeline_thread of a batch, the pipelines of a version run by a single dpp process
+        '''
+        pipeline_ids = [plan['pipeline_id'] for _, _, plan in batch]
+        pipeline_spec_paths = [f'{ROOT_DIR}/{plan["cache_id"]}/pipeline-spec.yaml' for _, _, plan in batch]
+        stopped = False
+
+        try:
+            if BcodmoPipeline._wait_for_slot(run, pipeline_spec_paths):
+                environment = get_environment(version)
+                command_list = [environment.dpp_command_path, 'run', '--concurrency', str(concurrency)]
+                if verbose:
+                    command_list.append('--verbose')
+                command_list.append(','.join(pipeline_ids))
+                stopped = BcodmoPipeline._supervise_process(
+                    run,
+                    environment,
+                    command_list,
+                    pipeline_ids,
+                    pipeline_spec_paths,
+                )
+            else:
+                stopped = True
+            BcodmoPipeline._release_slot(run)
+
+            succeeded = set()
+            if stopped:
+                # The pipelines that were done before the batch was stopped are finished as usual
+                statuses = status_backend.read(pipeline_ids)
+                succeeded = {plan['cache_id'] for _, _, plan in batch if statuses[plan['pipeline_id']]['success']}
+            for _, pipeline, plan in batch:
+                cache_id = plan['cache_id']
+                pipeline._finish_run(cache_id, stopped and cache_id not in succeeded, plan['pending_checkpoints'], plan['memo_key'], compression, columnar, profile)
+        finally:
+            BcodmoPipeline._release_run(run)
+
+    def _prepare_run(self, cache_id, num_rows, background, use_checkpoints, force, compression, columnar, progress, profile, validate):
+        '''
+        Validate a run and write its cache folder and pipeline-spec.yaml
+
+        Returns the result of the run if it is already over (invalid steps or memoized
+        results), otherwise what is needed to start and supervise it
         '''
         if not cache_id:
             cache_id = str(uuid.uuid1())
@@ -303,126 +1234,226 @@ class BcodmoPipeline:
         )
         if not pattern.match(cache_id):
             raise Exception('The unique ID that was provided was not in uuid format')
+        if compression is not None:
+            check_codec(compression)
+        if columnar:
+            check_columnar_available()
+        if validate:
+            start = time.time()
+            errors = validate_steps(self.version, self._steps)
+            BcodmoPipeline.log_slow_compute(start, cache_id, 'validating the steps')
+            if errors:
+                return {
+                    'status_code': 1,
+                    'cache_id': cache_id,
+                    'yaml': self.get_yaml(),
+                    'error_text': errors,
+                }, None
 
         ''' IMPORTANT '''
         # If the file structure between this file and the tmp folder
         # ever changes this code must change
         cache_dir = f'{ROOT_DIR}/{cache_id}'
         results_folder = f'{cache_dir}/results'
+        index_folder = f'{cache_dir}/index'
+        columnar_folder = f'{cache_dir}/columnar'
+        summary_path = f'{cache_dir}/summary.json'
+        progress_folder = f'{cache_dir}/progress'
+        profile_path = f'{cache_dir}/profile.json'
         # Create the directory and file
         if not os.path.exists(cache_dir):
             start = time.time()
             os.makedirs(cache_dir)
             BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the directories')
-        try:
-            start = time.time()
-            self.save_to_file(f'{cache_dir}/pipeline-spec.yaml.original', steps=self._steps)
-            BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the pipeline-spec.original.yaml file')
-            # Create a new save step so we can access the data here
-            new_save_step = {
-                'run': 'dump_to_path',
-                'parameters': {
-                    'out-path': results_folder,
-                    'temporal_format_property': 'outputFormat',
-                }
+        touch_cache_folder(cache_dir)
+        # Old cache folders are cleaned up in the background
+        janitor.ensure_started()
+
+        start = time.time()
+        self.save_to_file(f'{cache_dir}/pipeline-spec.yaml.original', steps=self._steps)
+        BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the pipeline-spec.original.yaml file')
+        # Create a new save step so we can access the data here
+        new_save_step = {
+            'run': 'dump_to_path',
+            'parameters': {
+                'out-path': results_folder,
+                'temporal_format_property': 'outputFormat',
             }
-            new_steps = self._steps + [new_save_step]
-            start = time.time()
-            self.save_to_file(f'{cache_dir}/pipeline-spec.yaml', steps=new_steps)
-            BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the pipeline-spec.yaml file')
+        }
+        pipeline_id = f'./{cache_id}/{self.name}'
 
-            # Remove the results folder
+        memo_key = get_memo_key(self.version, self._steps, compression)
+        if memo_key and not force:
             start = time.time()
             shutil.rmtree(results_folder, ignore_errors=True)
-            BcodmoPipeline.log_slow_compute(start, cache_id, 'removing the results folder')
-
-            start = time.time()
-            pipeline_id = f'./{cache_id}/{self.name}'
-            status = status_mgr(ROOT_DIR)
-            status.initialize()
-            pipeline_status = status.get(pipeline_id)
-            last_execution = pipeline_status.last_execution
-            BcodmoPipeline.log_slow_compute(start, cache_id, 'checking the status before creating a thread')
-            old_start_time = None
-            if last_execution:
-                old_start_time = last_execution.start_time
-
-            start = time.time()
-            x = threading.Thread(target=self.run_pipeline_thread, args=(cache_id, verbose,), daemon=True)
-            BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the thread')
-            start = time.time()
-            x.start()
-            BcodmoPipeline.log_slow_compute(start, cache_id, 'starting the thread')
-
-            if background:
-                while True:
-                    # Loop until the next pipeline has started
-                    start = time.time()
-                    status = status_mgr(ROOT_DIR)
-                    status.initialize()
-                    pipeline_status = status.get(pipeline_id)
-                    last_execution = pipeline_status.last_execution
-                    BcodmoPipeline.log_slow_compute(start, cache_id, 'checking the status after creating the thread')
-                    if last_execution and last_execution.start_time != old_start_time:
-                        break
-                    if x.is_alive():
-                        time.sleep(0.1)
-                    else:
-                        return {
-                            'status_code': 1,
-                            'cache_id': cache_id,
-                            'yaml': self.get_yaml(),
-                            'error_text': 'There was an unknown error in starting the pipeline',
-                        }
-
+            shutil.rmtree(index_folder, ignore_errors=True)
+            shutil.rmtree(columnar_folder, ignore_errors=True)
+            shutil.rmtree(progress_folder, ignore_errors=True)
+            for path in [summary_path, profile_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+            restored = restore_result(MEMO_DIR, memo_key, results_folder, summary_path)
+            BcodmoPipeline.log_slow_compute(start, cache_id, 'restoring memoized results')
+            if restored:
+                logger.info(f'Linked memoized results {memo_key} - {cache_id}')
+                self.save_to_file(f'{cache_dir}/pipeline-spec.yaml', steps=self._steps + [new_save_step])
+                if columnar:
+                    write_columnar(results_folder, columnar_folder)
+                if not os.path.exists(summary_path):
+                    # The results were stored without their summary
+                    write_summary(results_folder, summary_path)
+                BcodmoPipeline._record_execution(pipeline_id, True)
+                RUNS.inc(result='memoized')
+                if background:
+                    return {
+                        'status_code': 0,
+                        'cache_id': cache_id,
+                        'yaml': self.get_yaml(),
+                    }, None
+                pipeline_data = BcodmoPipeline.get_pipeline_data(cache_id, num_rows)
                 return {
                     'status_code': 0,
                     'cache_id': cache_id,
                     'yaml': self.get_yaml(),
-                }
+                    'datapackage': pipeline_data['datapackage'],
+                    'resources': pipeline_data['resources'],
+                }, None
+
+        if worker_pool.enabled:
+            # Warm up the workers of the version while the run is prepared and queued
+            environment = get_environment(self.version)
+            worker_pool.warm(environment.python_path, environment.env)
+
+        run_steps = self._steps
+        step_indices = list(range(len(self._steps)))
+        restored = 0
+        pending_checkpoints = []
+        if use_checkpoints:
+            start = time.time()
+            run_steps, step_indices, restored, pending_checkpoints = plan_checkpoints(
+                CHECKPOINT_DIR,
+                self.version,
+                self._steps,
+                cache_id,
+                restore=not force,
+            )
+            BcodmoPipeline.log_slow_compute(start, cache_id, 'looking up the checkpoints')
+            if restored:
+                logger.info(f'Restored the first {restored} steps from a checkpoint - {cache_id}')
+        shutil.rmtree(progress_folder, ignore_errors=True)
+        if os.path.exists(profile_path):
+            os.remove(profile_path)
+        new_steps = run_steps + [new_save_step]
+        if progress or profile:
+            new_steps = instrument_steps(
+                cache_dir,
+                new_steps,
+                progress_folder,
+                step_indices + [None],
+                self._steps[:restored],
+            )
+        start = time.time()
+        self.save_to_file(f'{cache_dir}/pipeline-spec.yaml', steps=new_steps)
+        BcodmoPipeline.log_slow_compute(start, cache_id, 'creating the pipeline-spec.yaml file')
+
+        # Remove the results folder and the row indexes, columnar files and summary built from it
+        start = time.time()
+        shutil.rmtree(results_folder, ignore_errors=True)
+        shutil.rmtree(index_folder, ignore_errors=True)
+        shutil.rmtree(columnar_folder, ignore_errors=True)
+        if os.path.exists(summary_path):
+            os.remove(summary_path)
+        BcodmoPipeline.log_slow_compute(start, cache_id, 'removing the results folder')
+
+        start = time.time()
+        status_backend.invalidate(pipeline_id)
+        status = status_backend.get_manager()
+        pipeline_status = status.get(pipeline_id)
+        last_execution = pipeline_status.last_execution
+        BcodmoPipeline.log_slow_compute(start, cache_id, 'checking the status before creating a thread')
+        old_start_time = None
+        if last_execution:
+            old_start_time = last_execution.start_time
+
+        return None, {
+            'cache_id': cache_id,
+            'pipeline_id': pipeline_id,
+            'pending_checkpoints': pending_checkpoints,
+            'memo_key': memo_key,
+            'status': status,
+            'old_start_time': old_start_time,
+        }
 
-            else:
-                # Join the thread
-                x.join()
-                status_dict = BcodmoPipeline.get_pipeline_status(cache_id, self.name)
-                if status_dict['success']:
-                    pipeline_data = BcodmoPipeline.get_pipeline_data(cache_id, num_rows)
-                    return {
-                        'status_code': 0,
-                        'cache_id': cache_id,
-                        'yaml': self.get_yaml(),
-                        'datapackage': pipeline_data['datapackage'],
-                        'resources': pipeline_data['resources'],
-                    }
-                else:
-                    return {
-                        'status_code': 1,
-                        'cache_id': cache_id,
-                        'yaml': self.get_yaml(),
-                        'error_text': status_dict.error_log,
-                    }
+    def _submit_run(self, cache_id, priority, background, limits, wake=None):
+        '''
+        Register a run and queue it in the scheduler
 
-        finally:
-            try:
-                start = time.time()
-                # Clean up the directory, deleting old folders
-                cur_time = time.time()
-                dirs = [
-                    folder_name for folder_name in os.listdir(f'{FILE_PATH}/tmp')
-                    if not folder_name.startswith('.')
-                ]
-                for folder_name in dirs:
-                    folder = f'{FILE_PATH}/tmp/{folder_name}'
-                    st = os.stat(folder)
-                    modified_time = st.st_mtime
-                    age = cur_time - modified_time
-
-                    if age > DAY * 30:
-                        shutil.rmtree(folder)
-                BcodmoPipeline.log_slow_compute(start, cache_id, 'checking age status of folders after complete')
-            except Exception as e:
-                logger.info(f'There was an error trying to clean up folder: {str(e)}')
-                logger.error(vars(e))
+        Returns the run, or the result to return if the queue is full
+        '''
+        run = register_run(cache_id, wake, {cache_id: f'./{cache_id}/{self.name}'})
+        run.limits = limits
+        if priority is None:
+            priority = PRIORITY_BACKGROUND if background else PRIORITY_INTERACTIVE
+        run.ticket = scheduler.submit(cache_id, self.version, priority, wake=run.wake)
+        if run.ticket is None:
+            unregister_run(run)
+            RUNS.inc(result='rejected')
+            return None, {
+                'status_code': 1,
+                'cache_id': cache_id,
+                'yaml': self.get_yaml(),
+                'error_text': 'Too many pipelines are queued, try again later',
+            }
+        return run, None
+
+    def _get_queued_result(self, cache_id):
+        return {
+            'status_code': 0,
+            'cache_id': cache_id,
+            'yaml': self.get_yaml(),
+            'queue_position': scheduler.position(cache_id),
+        }
+
+    def _get_start_error_result(self, cache_id):
+        return {
+            'status_code': 1,
+            'cache_id': cache_id,
+            'yaml': self.get_yaml(),
+            'error_text': 'There was an unknown error in starting the pipeline',
+        }
+
+    def _get_run_result(self, cache_id, num_rows):
+        status_dict = BcodmoPipeline.get_pipeline_status(cache_id, self.name)
+        if status_dict['success']:
+            pipeline_data = BcodmoPipeline.get_pipeline_data(cache_id, num_rows)
+            return {
+                'status_code': 0,
+                'cache_id': cache_id,
+                'yaml': self.get_yaml(),
+                'datapackage': pipeline_data['datapackage'],
+                'resources': pipeline_data['resources'],
+                'profile': status_dict['profile'],
+            }
+        else:
+            return {
+                'status_code': 1,
+                'cache_id': cache_id,
+                'yaml': self.get_yaml(),
+                'error_text': status_dict['error_log'],
+                'profile': status_dict['profile'],
+            }
+
+    @staticmethod
+    def _record_execution(pipeline_id, success, error_log=None):
+        '''
+        Record an execution that didn't go through dpp in the dpp status backend
+        '''
+        status_backend.invalidate(pipeline_id)
+        pipeline_status = status_backend.get(pipeline_id)
+        execution_id = gen_execution_id()
+        pipeline_status.queue_execution(execution_id, 'manual')
+        pipeline_status.start_execution(execution_id)
+        pipeline_status.finish_execution(execution_id, success, {}, error_log or [])
 
     def _confirm_valid(self, obj):
         ''' Confirm that an object is valid in the pipeline '''
@@ -436,16 +1467,30 @@ class BcodmoPipeline:
 
 
     def _get_yaml_format(self, steps=None):
-        if not steps:
-            steps = self._steps
-        return yaml.dump({
-            self.name: {
-                'title': self.title,
-                'description': self.description,
-                'version': self.version,
-                'pipeline': steps,
-            }
-        }, sort_keys=False)
+        '''
+        Get the pipeline-spec.yaml of this pipeline, with steps instead of its own steps if they are passed in
+
+        The spec is put together from the cached yaml of the header and of the steps
+        of this pipeline, only the steps that aren't part of it are dumped
+        '''
+        header_key = (self.name, self.title, self.description, self.version)
+        if header_key != self._header_key:
+            self._header_yaml = dump_header(*header_key)
+            self._header_key = header_key
+            self._yaml = None
+        while len(self._step_yamls) < len(self._steps):
+            self._step_yamls.append(dump_step(self._steps[len(self._step_yamls)]))
+
+        if not steps or steps is self._steps:
+            if self._yaml is None:
+                self._yaml = join_spec(self._header_yaml, self._step_yamls)
+            return self._yaml
+
+        step_yamls = {id(step): step_yaml for step, step_yaml in zip(self._steps, self._step_yamls)}
+        return join_spec(
+            self._header_yaml,
+            [step_yamls[id(step)] if id(step) in step_yamls else dump_step(step) for step in steps],
+        )
 
     def _parse_pipeline_spec(self, pipeline_spec):
         '''
@@ -453,7 +1498,7 @@ class BcodmoPipeline:
         '''
         stream = io.StringIO(pipeline_spec)
         try:
-            res = yaml.load(stream)
+            res = load_yaml(stream)
 
             # Get the name
             if type(res) != dict or len(res.keys()) != 1:
@@ -495,55 +1540,3 @@ class BcodmoPipeline:
         except yaml.YAMLError as e:
             raise e
         return name, title, description, version, steps
-
-    def _get_virtualenv_dir(self, version):
-        if self.version:
-            virtualenv_dir = os.path.join('/home/virtualenvs', self.version)
-            if os.path.exists(virtualenv_dir):
-                return virtualenv_dir
-        return None
-
-    def _get_version_paths(self, version):
-        # workon the python virtualenv associated with this version
-        virtualenv_dir = self._get_virtualenv_dir(version)
-        if virtualenv_dir:
-            dpp_command_path = os.path.join(virtualenv_dir, 'bin', 'dpp')
-            lib_path = os.path.join(virtualenv_dir, 'lib')
-            # Assume only one python version in the virtualenv lib folder
-            python_version = os.listdir(lib_path)[0]
-            processor_path = os.path.join(lib_path, python_version, 'site-packages', 'bcodmo_processors')
-
-            return dpp_command_path, processor_path
-
-        # If no specific dpp command found for this version, just return 'dpp'
-        return 'dpp', os.path.dirname(bcodmo_processors.__file__)
-
-    def _activate_virtualenv(self, version):
-        # Activate the virtual env
-        virtualenv_dir = self._get_virtualenv_dir(version)
-        if virtualenv_dir:
-            activate_file = os.path.join(virtualenv_dir, "bin", "activate_this.py")
-
-            # Set the env variable for later deactivation
-            self.prev_os_path = os.environ['PATH']
-            self.prev_sys_path = list(sys.path)
-            self.prev_prefix = sys.prefix
-
-            with open(activate_file) as f:
-                    code = compile(f.read(), activate_file, "exec")
-                    exec(code, { '__file__': activate_file })
-            return None
-        self.prev_os_path = None
-        self.prev_sys_path = None
-        self.prev_prefix = None
-        return None
-
-
-    def _deactivate_virtualenv(self):
-        # Deactivate the virtualenv
-        if self.prev_os_path and self.prev_sys_path and self.prev_prefix:
-            os.environ['PATH'] = self.prev_os_path
-            sys.path[:0] = self.prev_sys_path
-            sys.prefix = self.prev_prefix
-
-
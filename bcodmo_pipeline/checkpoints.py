@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import shutil
+
+from .utils import evict_lru
+
+# Day in seconds
+DAY = 60 * 60 * 24
+
+# Checkpoints are deleted when they haven't been used for this many seconds
+CHECKPOINT_MAX_AGE = int(os.environ.get('BCODMO_PIPELINE_CHECKPOINT_MAX_AGE', DAY))
+# Least recently used checkpoints are deleted when the store grows past this many bytes
+CHECKPOINT_MAX_BYTES = int(os.environ.get('BCODMO_PIPELINE_CHECKPOINT_MAX_BYTES', 10 * 1024 ** 3))
+
+
+def get_input_fingerprints(step):
+    '''
+    Get the size and modified time of the local files a step loads from
+
+    Remote urls are returned as is, they can't be fingerprinted without fetching them
+    '''
+    parameters = step.get('parameters') or {}
+    sources = parameters.get('from') if isinstance(parameters, dict) else None
+    if sources is None:
+        return []
+    if not isinstance(sources, list):
+        sources = [sources]
+    fingerprints = []
+    for source in sources:
+        if isinstance(source, str) and os.path.isfile(source):
+            st = os.stat(source)
+            fingerprints.append([source, st.st_size, st.st_mtime_ns])
+        else:
+            fingerprints.append([source])
+    return fingerprints
+
+
+def can_fingerprint(step):
+    '''
+    Whether every input of a step can be fingerprinted, which isn't the case of remote urls
+    '''
+    return all(len(fingerprint) > 1 for fingerprint in get_input_fingerprints(step))
+
+
+def get_prefix_hashes(version, steps):
+    '''
+    Get a hash for every prefix of steps: the ith hash identifies steps[:i + 1]
+
+    The hashes cover the processor version and the files loaded by the steps,
+    so a checkpoint is not reused once an input file has changed
+    '''
+    h = hashlib.sha256(json.dumps(version).encode('utf-8'))
+    hashes = []
+    for step in steps:
+        h.update(json.dumps(
+            [step, get_input_fingerprints(step)],
+            sort_keys=True,
+            default=str,
+        ).encode('utf-8'))
+        hashes.append(h.copy().hexdigest())
+    return hashes
+
+
+def plan_checkpoints(checkpoint_dir, version, steps, cache_id, restore=True):
+    '''
+    Rewrite steps so that the run starts from the longest stored checkpoint
+    and stores new checkpoints along the way
+
+    A checkpoint is only stored after the last step. dump_to_path casts the rows and
+    rewrites the schema it passes on, so a dump between two steps of the pipeline
+    would change what the next one receives, while the output of the last step goes
+    through the same dump before it is saved anyway. Returns the steps
+    to run, the index in steps of each of them (None for the load and dump steps
+    added here), the number of steps restored from a checkpoint and a list of
+    (partial, final) folders to pass to promote_checkpoints once the run is over
+
+    Checkpoints are neither stored nor reused past the first step that loads an
+    input that can't be fingerprinted (a remote url), it could have changed since.
+    If restore is False no checkpoint is reused, but the new one is still stored
+    '''
+    hashes = get_prefix_hashes(version, steps)
+    cacheable = 0
+    while cacheable < len(steps) and can_fingerprint(steps[cacheable]):
+        cacheable += 1
+
+    restored = 0
+    for i in range(cacheable if restore else 0, 0, -1):
+        checkpoint = os.path.join(checkpoint_dir, hashes[i - 1])
+        if os.path.exists(os.path.join(checkpoint, 'datapackage.json')):
+            # Mark the checkpoint as recently used
+            os.utime(checkpoint)
+            restored = i
+            break
+
+    run_steps = []
+    step_indices = []
+    if restored:
+        run_steps.append({
+            'run': 'load',
+            'parameters': {
+                'from': os.path.join(checkpoint_dir, hashes[restored - 1], 'datapackage.json'),
+            },
+        })
+        step_indices.append(None)
+
+    pending = []
+    for i in range(restored, len(steps)):
+        run_steps.append(steps[i])
+        step_indices.append(i)
+        if i + 1 == len(steps) and i + 1 <= cacheable:
+            final = os.path.join(checkpoint_dir, hashes[i])
+            partial = f'{final}.{cache_id}.partial'
+            run_steps.append({
+                'run': 'dump_to_path',
+                'parameters': {
+                    'out-path': partial,
+                },
+            })
+            step_indices.append(None)
+            pending.append((partial, final))
+    return run_steps, step_indices, restored, pending
+
+
+def promote_checkpoints(pending):
+    '''
+    Move the checkpoints that were completely dumped during a run into the store
+    '''
+    for partial, final in pending:
+        if not os.path.exists(os.path.join(partial, 'datapackage.json')) \
+                or os.path.exists(final):
+            shutil.rmtree(partial, ignore_errors=True)
+            continue
+        try:
+            os.replace(partial, final)
+        except OSError:
+            # Another run stored the same checkpoint first
+            shutil.rmtree(partial, ignore_errors=True)
+
+
+def discard_checkpoints(pending):
+    '''
+    Delete the partial checkpoints of a run that was stopped
+    '''
+    for partial, final in pending:
+        shutil.rmtree(partial, ignore_errors=True)
+
+
+def evict_checkpoints(checkpoint_dir):
+    '''
+    Delete the checkpoints that are too old or don't fit in the store
+    '''
+    return evict_lru(checkpoint_dir, CHECKPOINT_MAX_AGE, CHECKPOINT_MAX_BYTES)
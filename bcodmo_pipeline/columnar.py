@@ -0,0 +1,94 @@
+import os
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+from .results import get_resource_files, is_csv, load_datapackage
+
+# Arrow type of the table schema field types that aren't kept as strings,
+# every other field is read as a string so values like leading zeros are kept as is
+ARROW_TYPES = {
+    'integer': 'int64',
+    'year': 'int64',
+    'number': 'float64',
+    'boolean': 'bool_',
+}
+
+
+def check_columnar_available():
+    if pyarrow is None:
+        raise Exception('The pyarrow package must be installed to use columnar results')
+
+
+def write_columnar(data_folder, columnar_folder):
+    '''
+    Write every csv resource dumped into data_folder as an Arrow IPC file in
+    columnar_folder, typed from the schema in datapackage.json
+
+    The csv files are read in batches, so memory use doesn't depend on their size
+    '''
+    check_columnar_available()
+    os.makedirs(columnar_folder, exist_ok=True)
+    datapackage = load_datapackage(data_folder)
+    for resource_name, (data_file_path, descriptor) in get_resource_files(data_folder, datapackage).items():
+        if not is_csv(data_file_path):
+            continue
+        write_resource(
+            data_file_path,
+            descriptor,
+            os.path.join(columnar_folder, f'{resource_name}.arrow'),
+        )
+
+
+def write_resource(data_file_path, descriptor, arrow_path):
+    schema = (descriptor or {}).get('schema') or {}
+    column_types = {}
+    for field in schema.get('fields', []):
+        # Type every field explicitly, pyarrow would otherwise guess the type of the others from their values
+        arrow_type = ARROW_TYPES.get(field.get('type'), 'string')
+        column_types[field['name']] = getattr(pyarrow, arrow_type)()
+    convert_options = pyarrow.csv.ConvertOptions(
+        column_types=column_types,
+        null_values=schema.get('missingValues', ['']),
+        strings_can_be_null=True,
+    )
+
+    tmp_path = f'{arrow_path}.tmp'
+    # input_stream detects gzip and zstd compressed results from their suffix
+    with pyarrow.input_stream(data_file_path) as source:
+        reader = pyarrow.csv.open_csv(source, convert_options=convert_options)
+        with pyarrow.OSFile(tmp_path, 'wb') as sink:
+            with pyarrow.ipc.new_file(sink, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+    os.replace(tmp_path, arrow_path)
+
+
+def read_columnar(columnar_folder, resources=None, fields=None):
+    '''
+    Memory-map the Arrow IPC files in columnar_folder and return a pyarrow Table per resource
+
+    - resources is a collection of resource names, only those are opened if it is passed in
+    - fields is a list of field names, only those columns are kept if it is passed in
+    '''
+    check_columnar_available()
+    tables = {}
+    if not os.path.exists(columnar_folder):
+        return tables
+    for fname in sorted(os.listdir(columnar_folder)):
+        resource_name, ext = os.path.splitext(fname)
+        if ext != '.arrow' or (resources is not None and resource_name not in resources):
+            continue
+        source = pyarrow.memory_map(os.path.join(columnar_folder, fname), 'r')
+        table = pyarrow.ipc.open_file(source).read_all()
+        if fields is not None:
+            for field in fields:
+                if field not in table.column_names:
+                    raise Exception(f'Field "{field}" was not found in resource "{resource_name}"')
+            table = table.select(fields)
+        tables[resource_name] = table
+    return tables
@@ -0,0 +1,111 @@
+import gzip
+import io
+import os
+import shutil
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Suffix added to a result file compressed with each codec
+SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# Codec used to compress results when run_pipeline isn't told otherwise, unset keeps plain files
+DEFAULT_COMPRESSION = os.environ.get('BCODMO_PIPELINE_RESULT_COMPRESSION') or None
+
+
+def check_codec(codec):
+    if codec not in SUFFIXES:
+        raise Exception(f'Unknown compression "{codec}", must be one of {list(SUFFIXES.keys())}')
+    if codec == 'zstd' and zstandard is None:
+        raise Exception('The zstandard package must be installed to compress results with zstd')
+
+
+def get_codec(path):
+    '''
+    Get the codec a file was compressed with from its suffix, None if it isn't compressed
+    '''
+    for codec, suffix in SUFFIXES.items():
+        if path.endswith(suffix):
+            return codec
+    return None
+
+
+def strip_suffix(path):
+    '''
+    Get the path a file had before it was compressed
+    '''
+    codec = get_codec(path)
+    if codec is None:
+        return path
+    return path[:-len(SUFFIXES[codec])]
+
+
+def find_file(path):
+    '''
+    Find a result file that may have been compressed, None if there is none
+    '''
+    if os.path.exists(path):
+        return path
+    for suffix in SUFFIXES.values():
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return None
+
+
+def open_text(path):
+    '''
+    Open a result file for reading as text, decompressing it on the fly
+    '''
+    codec = get_codec(path)
+    if codec == 'gzip':
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if codec == 'zstd':
+        check_codec(codec)
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(
+            zstandard.ZstdDecompressor().stream_reader(raw),
+            encoding='utf-8',
+            newline='',
+        )
+    # newline='' like the csv module expects, so line breaks inside quoted values are kept as they are
+    return open(path, encoding='utf-8', newline='')
+
+
+def compress_file(path, codec):
+    '''
+    Replace a file by its compressed version and return the new path
+    '''
+    compressed_path = path + SUFFIXES[codec]
+    tmp_path = f'{compressed_path}.tmp'
+    with open(path, 'rb') as src:
+        if codec == 'gzip':
+            # zlib's default level, gzip.open defaults to the much slower 9
+            with gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            with open(tmp_path, 'wb') as raw:
+                with zstandard.ZstdCompressor().stream_writer(raw) as dst:
+                    shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, compressed_path)
+    os.remove(path)
+    return compressed_path
+
+
+def compress_results(data_folder, codec):
+    '''
+    Compress every data file dumped into data_folder
+
+    datapackage.json is left as is, so its resource paths still point at the
+    uncompressed names and readers locate the files with find_file
+    '''
+    check_codec(codec)
+    for root, dirs, files in os.walk(data_folder):
+        for fname in files:
+            if fname == 'datapackage.json' or get_codec(fname) is not None:
+                continue
+            compress_file(os.path.join(root, fname), codec)
@@ -0,0 +1,137 @@
+'''
+Warm dpp worker
+
+Run with the python of a processor version's virtualenv. The processor stack is
+imported once at startup, then every job read from stdin is run by a forked
+child that inherits the imports, so it starts without paying for them.
+
+This file is executed as a script, it must not import bcodmo_pipeline
+(which is not installed in the virtualenvs).
+
+Protocol, one json object per line:
+    stdin:  {"job": <id>, "args": [<dpp arguments>], "cwd": <dir>, "env": {<variables>}}
+            {"cancel": <id>}, the job is skipped if it hasn't been forked yet, killed otherwise
+    stdout: {"ready": true} once the imports are done, no job is sent before it
+            {"job": <id>, "pid": <pid of the child running the job>}
+            {"job": <id>, "exit": <exit code of the child>}
+'''
+import json
+import os
+import select
+import signal
+import sys
+
+# Import the processor stack up front so forked jobs don't have to
+import datapackage_pipelines.cli
+import datapackage_pipelines.manager
+import dataflows
+try:
+    import bcodmo_processors
+except ImportError:
+    pass
+
+
+def run_job(job):
+    '''
+    Run a dpp command in the forked child, never returns
+    '''
+    code = 1
+    try:
+        os.setsid()
+        os.chdir(job['cwd'])
+        os.environ.update(job.get('env') or {})
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        sys.stdin = open(os.devnull)
+        sys.stdout = open(os.devnull, 'w')
+        sys.stderr = open(os.devnull, 'w')
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        datapackage_pipelines.cli.cli.main(args=job['args'], prog_name='dpp')
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+    except BaseException:
+        pass
+    finally:
+        os._exit(code)
+
+
+def send(message):
+    sys.stdout.write(json.dumps(message) + '\n')
+    sys.stdout.flush()
+
+
+def main():
+    # SIGCHLD writes to the wakeup pipe so that exits are reported without polling
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    jobs = {}
+    cancelled = set()
+    buf = b''
+    stdin_open = True
+    send({'ready': True})
+    while stdin_open or jobs:
+        fds = [wakeup_r] + ([0] if stdin_open else [])
+        try:
+            ready, _, _ = select.select(fds, [], [])
+        except InterruptedError:
+            continue
+
+        if wakeup_r in ready:
+            os.read(wakeup_r, 1024)
+        # Reap every child that exited
+        while jobs:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in jobs:
+                if os.WIFSIGNALED(status):
+                    code = -os.WTERMSIG(status)
+                else:
+                    code = os.WEXITSTATUS(status)
+                send({'job': jobs.pop(pid), 'exit': code})
+
+        if 0 in ready:
+            data = os.read(0, 65536)
+            if not data:
+                # The host closed the pipe, exit once the running jobs are done
+                stdin_open = False
+                continue
+            buf += data
+            *lines, buf = buf.split(b'\n')
+            messages = [json.loads(line.decode('utf-8')) for line in lines if line.strip()]
+            # A job cancelled right behind it is never forked
+            cancelled.update(message['cancel'] for message in messages if 'cancel' in message)
+            for message in messages:
+                if 'cancel' in message:
+                    for pid, job_id in jobs.items():
+                        if job_id == message['cancel']:
+                            cancelled.discard(job_id)
+                            try:
+                                os.killpg(pid, signal.SIGKILL)
+                            except OSError:
+                                pass
+                    continue
+                if message['job'] in cancelled:
+                    cancelled.discard(message['job'])
+                    continue
+                pid = os.fork()
+                if pid == 0:
+                    run_job(message)
+                jobs[pid] = message['job']
+                send({'job': message['job'], 'pid': pid})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import threading
+from collections import namedtuple
+
+import bcodmo_processors
+import datapackage_pipelines
+
+VIRTUALENVS_DIR = '/home/virtualenvs'
+
+# Everything needed to start dpp for a processor version, without touching the host interpreter
+# - dpp_command_path is the dpp executable
+# - python_path is the python of the version, used by the warm workers
+# - processor_path is the bcodmo_processors folder passed to dpp as DPP_PROCESSOR_PATH
+# - standard_processor_path is the folder of the processors that ship with dpp
+# - env is the environment of the dpp process, with the virtualenv activated
+VersionEnvironment = namedtuple(
+    'VersionEnvironment',
+    ['dpp_command_path', 'python_path', 'processor_path', 'standard_processor_path', 'env'],
+)
+
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def get_virtualenv_dir(version):
+    if version:
+        virtualenv_dir = os.path.join(VIRTUALENVS_DIR, version)
+        if os.path.exists(virtualenv_dir):
+            return virtualenv_dir
+    return None
+
+
+def get_environment(version):
+    '''
+    Get the environment of a processor version, it is only built on first use
+    '''
+    with _environments_lock:
+        if version not in _environments:
+            _environments[version] = build_environment(version)
+        return _environments[version]
+
+
+def build_environment(version):
+    env = dict(os.environ)
+    # workon the python virtualenv associated with this version
+    virtualenv_dir = get_virtualenv_dir(version)
+    if virtualenv_dir:
+        bin_path = os.path.join(virtualenv_dir, 'bin')
+        dpp_command_path = os.path.join(bin_path, 'dpp')
+        python_path = os.path.join(bin_path, 'python')
+        lib_path = os.path.join(virtualenv_dir, 'lib')
+        # Assume only one python version in the virtualenv lib folder
+        python_version = os.listdir(lib_path)[0]
+        site_packages_path = os.path.join(lib_path, python_version, 'site-packages')
+        processor_path = os.path.join(site_packages_path, 'bcodmo_processors')
+        standard_processor_path = os.path.join(site_packages_path, 'datapackage_pipelines', 'lib')
+
+        # The same changes to the environment as bin/activate
+        env['PATH'] = os.pathsep.join([bin_path, env.get('PATH', '')])
+        env['VIRTUAL_ENV'] = virtualenv_dir
+        env.pop('PYTHONHOME', None)
+    else:
+        # If no specific dpp command found for this version, just use 'dpp'
+        dpp_command_path = 'dpp'
+        python_path = sys.executable
+        processor_path = os.path.dirname(bcodmo_processors.__file__)
+        standard_processor_path = os.path.join(os.path.dirname(datapackage_pipelines.__file__), 'lib')
+
+    env['DPP_PROCESSOR_PATH'] = processor_path
+    return VersionEnvironment(dpp_command_path, python_path, processor_path, standard_processor_path, env)
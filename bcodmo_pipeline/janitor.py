@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+import time
+
+from .checkpoints import DAY, evict_checkpoints
+from .memo import evict_results
+from .metrics import SWEEP_BYTES, SWEEP_SECONDS
+from .runs import find_run
+from .utils import evict_lru
+
+logger = logging.getLogger(__name__)
+
+# Cache folders are deleted when they haven't been accessed for this many seconds
+CACHE_MAX_AGE = int(os.environ.get('BCODMO_PIPELINE_CACHE_MAX_AGE', 30 * DAY))
+# Least recently accessed cache folders are deleted when tmp grows past this many bytes
+CACHE_MAX_BYTES = int(os.environ.get('BCODMO_PIPELINE_CACHE_MAX_BYTES', 50 * 1024 ** 3))
+# Seconds between two sweeps of the janitor
+JANITOR_INTERVAL = int(os.environ.get('BCODMO_PIPELINE_JANITOR_INTERVAL', 10 * 60))
+
+# File touched inside a cache folder every time it is accessed
+ACCESS_FILE = '.last_access'
+
+
+def touch_cache_folder(cache_dir):
+    '''
+    Mark a cache folder as recently accessed
+    '''
+    try:
+        with open(os.path.join(cache_dir, ACCESS_FILE), 'a'):
+            pass
+        os.utime(os.path.join(cache_dir, ACCESS_FILE))
+    except OSError:
+        pass
+
+
+def get_last_access(cache_dir):
+    access_file = os.path.join(cache_dir, ACCESS_FILE)
+    if os.path.exists(access_file):
+        return os.path.getmtime(access_file)
+    return os.path.getmtime(cache_dir)
+
+
+class Janitor:
+    '''
+    Cleans up the tmp folder in a background thread
+
+    Every sweep deletes the cache folders that haven't been accessed for
+    CACHE_MAX_AGE seconds, then the least recently accessed ones until tmp
+    fits in CACHE_MAX_BYTES, and evicts old checkpoints and memoized results.
+    Folders of runs that are active in this process are never deleted.
+    '''
+    def __init__(self, root_dir, checkpoint_dir, memo_dir, interval=JANITOR_INTERVAL):
+        self.root_dir = root_dir
+        self.checkpoint_dir = checkpoint_dir
+        self.memo_dir = memo_dir
+        self.interval = interval
+        self.last_report = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f'There was an error trying to clean up the tmp folder: {str(e)}')
+            time.sleep(self.interval)
+
+    def sweep(self):
+        '''
+        Run a sweep now and return a report of what was reclaimed
+        '''
+        with self._sweep_lock:
+            start = time.time()
+            removed, removed_bytes = evict_lru(
+                self.root_dir,
+                CACHE_MAX_AGE,
+                CACHE_MAX_BYTES,
+                skip=self._skip,
+                last_used=get_last_access,
+                ignore=self._ignore,
+            )
+            checkpoints_removed, checkpoint_bytes = evict_checkpoints(self.checkpoint_dir)
+            memo_removed, memo_bytes = evict_results(self.memo_dir)
+            report = {
+                'removed': removed,
+                'checkpoints_removed': len(checkpoints_removed),
+                'memo_removed': len(memo_removed),
+                'bytes_reclaimed': removed_bytes + checkpoint_bytes + memo_bytes,
+                'finish_time': time.time(),
+                'duration': time.time() - start,
+            }
+            logger.info(
+                f'Cleaned up {len(removed)} cache folders, {len(checkpoints_removed)} checkpoints '
+                f'and {len(memo_removed)} memoized results, reclaiming {report["bytes_reclaimed"]} bytes'
+            )
+            SWEEP_SECONDS.observe(report['duration'])
+            SWEEP_BYTES.inc(report['bytes_reclaimed'])
+            self.last_report = report
+            return report
+
+    def _ignore(self, folder_name):
+        # Hidden folders are the checkpoint and memo stores, which have their own quotas,
+        # and the dpp status backend. None of them count towards CACHE_MAX_BYTES
+        return folder_name.startswith('.')
+
+    def _skip(self, folder_name):
+        # A batch is registered under an id of its own, find_run also finds it by the cache_id of its pipelines
+        return find_run(folder_name) is not None
@@ -0,0 +1,166 @@
+import logging
+import os
+import time
+from collections import namedtuple
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# The resources a run may use, 0 for no limit
+# - memory is the number of bytes of resident memory of all of the processes of the run
+# - cpu_time is the number of seconds of CPU used by all of the processes of the run
+# - wall_time is the number of seconds the run may last once dpp is started
+RunLimits = namedtuple('RunLimits', ['memory', 'cpu_time', 'wall_time'])
+
+DEFAULT_LIMITS = RunLimits(
+    memory=int(os.environ.get('BCODMO_PIPELINE_RUN_MAX_MEMORY', 0)),
+    cpu_time=float(os.environ.get('BCODMO_PIPELINE_RUN_MAX_CPU_TIME', 0)),
+    wall_time=float(os.environ.get('BCODMO_PIPELINE_RUN_TIMEOUT', 0)),
+)
+# Seconds between two checks of the processes of a run that has limits
+LIMIT_CHECK_INTERVAL = float(os.environ.get('BCODMO_PIPELINE_LIMIT_CHECK_INTERVAL', 0.5))
+# A cgroup v2 folder delegated to this process. If it is set every run gets a child cgroup
+# where the kernel enforces the memory limit, instead of it only being polled
+CGROUP_ROOT = os.environ.get('BCODMO_PIPELINE_CGROUP_ROOT')
+
+MEMORY_ERROR = 'killed: exceeded memory limit'
+CPU_TIME_ERROR = 'killed: exceeded CPU time limit'
+WALL_TIME_ERROR = 'killed: exceeded wall-clock time limit'
+
+
+def get_limits(limits=None):
+    '''
+    Get the limits of a run, DEFAULT_LIMITS if none are passed in
+
+    limits can be a RunLimits or a dictionary with some of its fields, the others are taken from DEFAULT_LIMITS
+    '''
+    if limits is None:
+        return DEFAULT_LIMITS
+    if isinstance(limits, dict):
+        unknown = set(limits.keys()) - set(RunLimits._fields)
+        if unknown:
+            raise Exception(f'Unknown limits {sorted(unknown)}, must be some of {list(RunLimits._fields)}')
+        limits = DEFAULT_LIMITS._replace(**limits)
+    for name, value in limits._asdict().items():
+        if not isinstance(value, (int, float)) or value < 0:
+            raise Exception(f'The limit {name} "{value}" must be a number that is not negative')
+    return limits
+
+
+class LimitMonitor:
+    '''
+    Checks the processes of a run against its limits
+
+    The processes are those in the tree of the dpp process. Memory is the sum of
+    their resident memory, CPU time the sum of their CPU time and of the children they
+    have already waited for. With CGROUP_ROOT set the run is also moved to a cgroup
+    of its own, where going over the memory limit gets the whole run killed by the kernel
+    '''
+    def __init__(self, limits, name):
+        self.limits = limits
+        self.name = name
+        self.start_time = None
+        self.cgroup_path = None
+        self._process = None
+
+    @property
+    def active(self):
+        return any(self.limits)
+
+    def attach(self, pid):
+        '''
+        Start watching the dpp process of the run, right after it is spawned
+        '''
+        self.start_time = time.time()
+        if not self.active or pid is None:
+            return
+        try:
+            self._process = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            return
+        if CGROUP_ROOT and self.limits.memory:
+            try:
+                self._create_cgroup(pid)
+            except OSError as e:
+                logger.error(f'Could not put the run in a cgroup, its memory is only polled: {str(e)}')
+                self.close()
+
+    def check(self):
+        '''
+        Get the error of the first limit the run went over, None if it is within all of them
+        '''
+        if not self.active:
+            return None
+        if self._oom_killed():
+            return MEMORY_ERROR
+        if self.limits.wall_time and time.time() - self.start_time > self.limits.wall_time:
+            return WALL_TIME_ERROR
+        if self._process is None or not (self.limits.memory or self.limits.cpu_time):
+            return None
+
+        memory = 0
+        cpu_time = 0
+        try:
+            processes = [self._process] + self._process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return None
+        for process in processes:
+            try:
+                with process.oneshot():
+                    memory += process.memory_info().rss
+                    times = process.cpu_times()
+                    cpu_time += times.user + times.system + times.children_user + times.children_system
+            except psutil.NoSuchProcess:
+                pass
+        if self.limits.memory and memory > self.limits.memory:
+            return MEMORY_ERROR
+        if self.limits.cpu_time and cpu_time > self.limits.cpu_time:
+            return CPU_TIME_ERROR
+        return None
+
+    def check_exit(self):
+        '''
+        Get the error of a run whose processes have all exited, if the kernel killed them
+        '''
+        return MEMORY_ERROR if self._oom_killed() else None
+
+    def close(self):
+        if self.cgroup_path is not None:
+            try:
+                os.rmdir(self.cgroup_path)
+            except OSError as e:
+                logger.error(f'Could not remove the cgroup {self.cgroup_path}: {str(e)}')
+            self.cgroup_path = None
+
+    def _create_cgroup(self, pid):
+        if not os.path.exists(os.path.join(CGROUP_ROOT, 'cgroup.controllers')):
+            raise OSError(f'{CGROUP_ROOT} is not a cgroup v2 folder')
+        self.cgroup_path = os.path.join(CGROUP_ROOT, f'bcodmo-{self.name}')
+        try:
+            os.mkdir(self.cgroup_path)
+        except FileExistsError:
+            pass
+        self._write_cgroup('memory.max', str(int(self.limits.memory)))
+        # Kill every process of the run at once rather than a single one of them
+        self._write_cgroup('memory.oom.group', '1')
+        if os.path.exists(os.path.join(self.cgroup_path, 'memory.swap.max')):
+            self._write_cgroup('memory.swap.max', '0')
+        self._write_cgroup('cgroup.procs', str(pid))
+
+    def _write_cgroup(self, fname, value):
+        with open(os.path.join(self.cgroup_path, fname), 'w') as f:
+            f.write(value)
+
+    def _oom_killed(self):
+        if self.cgroup_path is None:
+            return False
+        try:
+            with open(os.path.join(self.cgroup_path, 'memory.events')) as f:
+                for line in f:
+                    key, value = line.split()
+                    if key == 'oom_kill' and int(value) > 0:
+                        return True
+        except OSError:
+            pass
+        return False
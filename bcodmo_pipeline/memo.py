@@ -0,0 +1,100 @@
+import os
+import shutil
+import uuid
+
+from .checkpoints import DAY, can_fingerprint, get_prefix_hashes
+from .utils import evict_lru
+
+# Memoized results are deleted when they haven't been used for this many seconds
+MEMO_MAX_AGE = int(os.environ.get('BCODMO_PIPELINE_MEMO_MAX_AGE', 7 * DAY))
+# Least recently used results are deleted when the store grows past this many bytes
+MEMO_MAX_BYTES = int(os.environ.get('BCODMO_PIPELINE_MEMO_MAX_BYTES', 10 * 1024 ** 3))
+# Name of the summary of the results in a stored entry, next to their datapackage.json
+SUMMARY_FILE = 'summary.json'
+
+
+def get_memo_key(version, steps, compression=None):
+    '''
+    Get the key identifying the results of running steps with a processor version,
+    stored compressed with compression (None for plain files)
+
+    Returns None if the results can't be memoized because a step loads a
+    remote url, which could have changed since the results were stored
+    '''
+    if not steps:
+        return None
+    if not all(can_fingerprint(step) for step in steps):
+        return None
+    key = get_prefix_hashes(version, steps)[-1]
+    if compression is not None:
+        key = f'{key}-{compression}'
+    return key
+
+
+def link_file(src_path, dst_path):
+    '''
+    Hard link src_path to dst_path, copying it if they are on different devices
+    '''
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copy2(src_path, dst_path)
+
+
+def link_tree(src, dst, exclude=()):
+    '''
+    Recreate the files of src in dst as hard links, copying them if they are
+    on different devices
+
+    The files at the top of src whose name is in exclude are left out
+    '''
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target_root, exist_ok=True)
+        for fname in files:
+            if root == src and fname in exclude:
+                continue
+            link_file(os.path.join(root, fname), os.path.join(target_root, fname))
+
+
+def restore_result(memo_dir, key, results_folder, summary_path=None):
+    '''
+    Link the stored results for key into results_folder, and their summary
+    to summary_path if it is passed in and was stored with them
+
+    Returns False if there are no stored results for key
+    '''
+    entry = os.path.join(memo_dir, key)
+    if not os.path.exists(os.path.join(entry, 'datapackage.json')):
+        return False
+    # Mark the entry as recently used
+    os.utime(entry)
+    link_tree(entry, results_folder, exclude=[SUMMARY_FILE])
+    if summary_path is not None and os.path.exists(os.path.join(entry, SUMMARY_FILE)):
+        link_file(os.path.join(entry, SUMMARY_FILE), summary_path)
+    return True
+
+
+def store_result(memo_dir, key, results_folder, summary_path=None):
+    '''
+    Store the results of a successful run under key, with their summary if summary_path is passed in
+    '''
+    entry = os.path.join(memo_dir, key)
+    if os.path.exists(entry) or not os.path.exists(os.path.join(results_folder, 'datapackage.json')):
+        return
+    partial = f'{entry}.{uuid.uuid4().hex}.partial'
+    link_tree(results_folder, partial)
+    if summary_path is not None and os.path.exists(summary_path):
+        link_file(summary_path, os.path.join(partial, SUMMARY_FILE))
+    try:
+        os.replace(partial, entry)
+    except OSError:
+        # Another run stored the same results first
+        shutil.rmtree(partial, ignore_errors=True)
+
+
+def evict_results(memo_dir):
+    '''
+    Delete the stored results that are too old or don't fit in the store
+    '''
+    return evict_lru(memo_dir, MEMO_MAX_AGE, MEMO_MAX_BYTES)
@@ -0,0 +1,220 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the histogram buckets, from bookkeeping that takes
+# a few milliseconds up to runs that take an hour
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600,
+)
+
+# Quantiles estimated in the json snapshot of a histogram
+SNAPSHOT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ''
+    inner = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + inner + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    '''
+    A value that only goes up, one per combination of label values
+    '''
+    type_name = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def to_prometheus(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in values]
+
+    def snapshot(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [{'labels': dict(key), 'value': value} for key, value in values]
+
+
+class Histogram:
+    '''
+    Counts of observed durations in fixed buckets, one set of buckets per
+    combination of label values
+
+    Quantiles are estimated from the buckets the same way Prometheus'
+    histogram_quantile does, by interpolating inside the bucket they fall in
+    '''
+    type_name = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        '''
+        Observe the time spent inside the with block
+        '''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def quantile(self, q, counts, count):
+        if count == 0:
+            return None
+        rank = q * count
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                upper = self.buckets[i]
+                lower = self.buckets[i - 1] if i > 0 else 0
+                if upper == math.inf:
+                    # Nothing is known above the last bound
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-2]
+
+    def _copy_series(self):
+        with self._lock:
+            return sorted(
+                (key, list(series['counts']), series['sum'], series['count'])
+                for key, series in self._series.items()
+            )
+
+    def to_prometheus(self):
+        lines = []
+        for key, counts, total, count in self._copy_series():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(key, [("le", _format_value(bound))])} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+    def snapshot(self):
+        snapshot = []
+        for key, counts, total, count in self._copy_series():
+            snapshot.append({
+                'labels': dict(key),
+                'count': count,
+                'sum': total,
+                'quantiles': {
+                    f'p{int(q * 100)}': self.quantile(q, counts, count)
+                    for q in SNAPSHOT_QUANTILES
+                },
+            })
+        return snapshot
+
+
+class MetricsRegistry:
+    def __init__(self, prefix='bcodmo_pipeline_'):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args):
+        name = f'{self.prefix}{name}'
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args)
+            metric = self._metrics[name]
+        if not isinstance(metric, cls):
+            raise Exception(f'The metric "{name}" was already registered as a {metric.type_name}')
+        return metric
+
+    def counter(self, name, description):
+        return self._register(Counter, name, description)
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, description, buckets)
+
+    def _sorted_metrics(self):
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+    def to_prometheus(self):
+        '''
+        Export every metric in the Prometheus text exposition format
+        '''
+        lines = []
+        for metric in self._sorted_metrics():
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(metric.to_prometheus())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        '''
+        Get a json serializable snapshot of every metric, with the p50, p90
+        and p99 of the histograms
+        '''
+        return {
+            metric.name: {
+                'type': metric.type_name,
+                'description': metric.description,
+                'values': metric.snapshot(),
+            }
+            for metric in self._sorted_metrics()
+        }
+
+
+registry = MetricsRegistry()
+
+# Metrics shared by the modules of the library
+RUNS = registry.counter('runs_total', 'Runs by how they ended: success, failure, stopped, memoized or rejected')
+RUN_START_SECONDS = registry.histogram('run_start_seconds', 'Time from the call to run_pipeline until dpp is spawned')
+RUN_SECONDS = registry.histogram('run_seconds', 'Time from spawning dpp until it exits')
+QUEUE_WAIT_SECONDS = registry.histogram('queue_wait_seconds', 'Time a run waits for a slot in the scheduler')
+SPAWN_SECONDS = registry.histogram('spawn_seconds', 'Time spent spawning the dpp process, by how it was spawned')
+STATUS_SECONDS = registry.histogram('status_seconds', 'Time spent looking up the status of a run')
+READ_SECONDS = registry.histogram('read_seconds', 'Time spent reading results, by reader')
+SWEEP_SECONDS = registry.histogram('sweep_seconds', 'Time spent in a sweep of the janitor')
+SWEEP_BYTES = registry.counter('sweep_reclaimed_bytes_total', 'Bytes reclaimed by the janitor')
+COMPUTE_SECONDS = registry.histogram('compute_seconds', 'Time spent in the bookkeeping of a run, by phase')
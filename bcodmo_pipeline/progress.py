@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+
+# Name of the instrumentation processor inside a cache folder, dpp finds it next to the pipeline-spec.yaml
+PROGRESS_PROCESSOR = 'bcodmo_pipeline_progress'
+PROGRESS_PROCESSOR_SOURCE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'progress_processor.py')
+# Minimum seconds between two writes of the progress file of a step
+PROGRESS_INTERVAL = float(os.environ.get('BCODMO_PIPELINE_PROGRESS_INTERVAL', 1))
+
+
+def instrument_steps(cache_dir, steps, progress_folder, step_indices, restored_steps=()):
+    '''
+    Insert a progress step after every step of a run
+
+    Each progress step counts the rows coming out of the step before it and writes
+    them to <progress_folder>/<position>.json, see progress_processor.py
+
+    step_indices has the index of every step in the steps of the pipeline, None for
+    the steps that were added to the run (checkpoint loads and dumps and the save
+    step). Those are marked as injected in their progress. restored_steps are
+    the steps of the pipeline restored from a checkpoint, they are recorded in the
+    progress of the first step, which loads the checkpoint
+    '''
+    shutil.copyfile(PROGRESS_PROCESSOR_SOURCE, os.path.join(cache_dir, f'{PROGRESS_PROCESSOR}.py'))
+    os.makedirs(progress_folder, exist_ok=True)
+    instrumented_steps = []
+    for position, (step, step_index) in enumerate(zip(steps, step_indices)):
+        parameters = {
+            'out-path': os.path.join(progress_folder, f'{position}.json'),
+            'position': position,
+            'step': step_index,
+            'run': step['run'],
+            'injected': step_index is None,
+            'interval': PROGRESS_INTERVAL,
+        }
+        if position == 0 and restored_steps:
+            parameters['restored'] = [
+                {'step': i, 'run': restored_step['run']}
+                for i, restored_step in enumerate(restored_steps)
+            ]
+        instrumented_steps.append(step)
+        instrumented_steps.append({
+            'run': PROGRESS_PROCESSOR,
+            'parameters': parameters,
+        })
+    return instrumented_steps
+
+
+def load_progress(progress_folder):
+    '''
+    Read the progress files of a run and get the progress of every step that has
+    started so far, in the order they run, and the index of the step of the pipeline
+    currently executing
+
+    The steps injected in the run are included, marked as injected and with a step of None.
+    Every step streams its rows to the next one as soon as they are processed, so
+    the current step is the first step of the pipeline that hasn't gone through all of its rows
+    '''
+    steps = []
+    if os.path.exists(progress_folder):
+        for fname in os.listdir(progress_folder):
+            if not fname.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(progress_folder, fname)) as f:
+                    steps.append(json.load(f))
+            except (OSError, ValueError):
+                # The file was replaced or removed while it was read
+                continue
+    steps.sort(key=lambda step: step['position'])
+
+    current_step = None
+    for step in steps:
+        if not step['done'] and not step['injected']:
+            current_step = step['step']
+            break
+    return steps, current_step
+
+
+def build_profile(progress_folder):
+    '''
+    Build the timing and throughput profile of a finished run from its progress files
+
+    The steps of a run all stream at once, so the wall time of a step is how much
+    later it finished than the step before it, which is the time it added to the run.
+    rows_per_sec is the number of rows that came out of the step divided by the time
+    between its first and last row
+
+    step is the index of the step in the pipeline. The steps restored from a checkpoint
+    come first, with restored set and no timings. The steps injected in the run
+    (checkpoint loads and dumps and the save step) have injected set and
+    a step of None
+    '''
+    steps, _ = load_progress(progress_folder)
+    profile = []
+    # The first step of a run restored from a checkpoint loads it, and records the steps it replaces
+    restored_steps = steps[0].get('restored', []) if steps else []
+    for restored_step in restored_steps:
+        profile.append({
+            'step': restored_step['step'],
+            'run': restored_step['run'],
+            'wall_time': 0,
+            'rows_in': None,
+            'rows_out': None,
+            'rows_per_sec': None,
+            'done': True,
+            'injected': False,
+            'restored': True,
+        })
+    previous = None
+    for step in steps:
+        rows_out = sum(step['rows'].values())
+        finish_time = step.get('finish_time') or step['update_time']
+        if previous is None:
+            wall_time = finish_time - step['start_time']
+            rows_in = None
+        else:
+            wall_time = finish_time - (previous.get('finish_time') or previous['update_time'])
+            rows_in = sum(previous['rows'].values())
+        active_time = finish_time - (step.get('first_row_time') or finish_time)
+        profile.append({
+            'step': step['step'],
+            'run': step['run'],
+            'wall_time': max(wall_time, 0),
+            'rows_in': rows_in,
+            'rows_out': rows_out,
+            'rows_per_sec': rows_out / active_time if active_time > 0 else None,
+            'done': step['done'],
+            'injected': step['injected'],
+            'restored': False,
+        })
+        previous = step
+    return profile
+
+
+def write_profile(progress_folder, profile_path):
+    profile = build_profile(progress_folder)
+    tmp_path = f'{profile_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(profile, f)
+    os.replace(tmp_path, profile_path)
+    return profile
+
+
+def load_profile(profile_path):
+    '''
+    Load the profile written by write_profile, None if there is none
+    '''
+    if not os.path.exists(profile_path):
+        return None
+    with open(profile_path) as f:
+        return json.load(f)
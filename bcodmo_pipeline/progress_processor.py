@@ -0,0 +1,72 @@
+'''
+dpp processor inserted after every step of a run started with progress=True or profile=True
+
+It passes the rows through untouched while counting them per resource, and
+regularly writes the counts to its own json file in the progress folder of the
+run. It is copied into the cache folder so dpp resolves it next to the
+pipeline-spec.yaml, and runs with the python of the processor version, so it
+must not import bcodmo_pipeline.
+'''
+import json
+import os
+import time
+
+from datapackage_pipelines.wrapper import ingest, spew
+
+# Rows between two checks of the clock
+CHECK_EVERY = 1000
+
+
+def main():
+    parameters, datapackage, resource_iterator = ingest()
+    out_path = parameters['out-path']
+    interval = parameters.get('interval', 1)
+    progress = {
+        'position': parameters['position'],
+        'step': parameters['step'],
+        'run': parameters['run'],
+        'injected': parameters.get('injected', False),
+        'restored': parameters.get('restored', []),
+        'rows': {},
+        'done': False,
+        'start_time': time.time(),
+        'first_row_time': None,
+        'finish_time': None,
+        'update_time': None,
+    }
+    last_write = [0]
+
+    def write(force=False):
+        now = time.time()
+        if not force and now - last_write[0] < interval:
+            return
+        last_write[0] = now
+        progress['update_time'] = now
+        tmp_path = f'{out_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, out_path)
+
+    def count(resource):
+        name = resource.spec['name']
+        progress['rows'][name] = 0
+        for row in resource:
+            if progress['first_row_time'] is None:
+                progress['first_row_time'] = time.time()
+            progress['rows'][name] += 1
+            if progress['rows'][name] % CHECK_EVERY == 0:
+                write()
+            yield row
+        write(force=True)
+
+    def finalize():
+        progress['done'] = True
+        progress['finish_time'] = time.time()
+        write(force=True)
+
+    write(force=True)
+    spew(datapackage, (count(resource) for resource in resource_iterator), finalizer=finalize)
+
+
+if __name__ == '__main__':
+    main()
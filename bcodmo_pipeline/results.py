@@ -0,0 +1,266 @@
+import csv
+import itertools
+import json
+import os
+from contextlib import contextmanager
+
+from .compression import find_file, get_codec, open_text, strip_suffix
+
+# Number of rows between two entries of a row offset index
+INDEX_STRIDE = 1024
+
+
+class _OffsetLineReader:
+    '''
+    Iterates over the lines of a binary file while keeping track of the
+    byte offset of the next unread line
+
+    csv.reader only pulls the lines it needs for a single record, so after each
+    call to next(reader) the offset is the start of the next record, even for
+    quoted values that span multiple lines
+    '''
+    def __init__(self, f):
+        self._f = f
+        self.offset = f.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self._f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode('utf-8')
+
+
+def build_row_index(data_file_path):
+    '''
+    Scan a csv file once and record the byte offset of every INDEX_STRIDE-th row
+    '''
+    st = os.stat(data_file_path)
+    offsets = []
+    row_count = 0
+    with open(data_file_path, 'rb') as f:
+        lines = _OffsetLineReader(f)
+        reader = csv.reader(lines)
+        try:
+            # Skip the header
+            next(reader)
+            while True:
+                offset = lines.offset
+                next(reader)
+                if row_count % INDEX_STRIDE == 0:
+                    offsets.append(offset)
+                row_count += 1
+        except StopIteration:
+            pass
+    return {
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'stride': INDEX_STRIDE,
+        'row_count': row_count,
+        'offsets': offsets,
+    }
+
+
+def load_row_index(data_file_path, index_path):
+    '''
+    Load the row offset index of a csv file, building it if it doesn't exist
+    or if the csv file has changed since the index was written
+    '''
+    st = os.stat(data_file_path)
+    if os.path.exists(index_path):
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if index['size'] == st.st_size and index['mtime_ns'] == st.st_mtime_ns:
+                return index
+        except (ValueError, KeyError):
+            pass
+
+    index = build_row_index(data_file_path)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    # Write to a temporary file first so concurrent readers never see a partial index
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    return index
+
+
+@contextmanager
+def open_rows(data_file_path, offset=0, index_path=None, fields=None, field_names=None):
+    '''
+    Open a csv file, decompressing it if it was compressed, and yield its
+    header and an iterator over its rows
+
+    - offset is the number of rows to skip before the iterator starts
+    - index_path is where the row offset index for this file is stored. If it
+      is passed in, offset is not 0 and the file isn't compressed, the index is
+      used to seek close to the first row instead of parsing the file from the top
+    - fields is a list of field names to keep, in order. The other columns
+      are dropped from the header and from every row
+    - field_names are the names of the columns of the file, taken from the
+      resource schema. If they are not passed in the csv header is used
+    '''
+    try:
+        f, header, rows = _open_rows(data_file_path, offset, index_path)
+    except FileNotFoundError:
+        # The file was compressed after it was located, by a run that was still finishing
+        moved_path = find_file(strip_suffix(data_file_path))
+        if moved_path is None or moved_path == data_file_path:
+            raise
+        data_file_path = moved_path
+        f, header, rows = _open_rows(data_file_path, offset, index_path)
+    with f:
+        yield _project(header, rows, fields, field_names, data_file_path)
+
+
+def _open_rows(data_file_path, offset, index_path):
+    '''
+    Open a csv file and return the file, its header and an iterator over its rows
+    '''
+    # Compressed files can't be seeked into cheaply, they are always read from the top
+    if offset > 0 and index_path and get_codec(data_file_path) is None:
+        index = load_row_index(data_file_path, index_path)
+        block = offset // index['stride']
+        f = open(data_file_path, 'rb')
+        reader = csv.reader(_OffsetLineReader(f))
+        header = next(reader, [])
+        if block < len(index['offsets']):
+            f.seek(index['offsets'][block])
+            reader = csv.reader(_OffsetLineReader(f))
+            rows = itertools.islice(reader, offset - block * index['stride'], None)
+        else:
+            rows = iter(())
+    else:
+        f = open_text(data_file_path)
+        reader = csv.reader(f)
+        header = next(reader, [])
+        rows = itertools.islice(reader, offset, None)
+    return f, header, rows
+
+
+def _project(header, rows, fields, field_names, data_file_path):
+    if fields is None:
+        return header, rows
+    if field_names is None:
+        field_names = header
+    indices = []
+    for field in fields:
+        if field not in field_names:
+            raise Exception(f'Field "{field}" was not found in {os.path.basename(data_file_path)}')
+        indices.append(field_names.index(field))
+    return [header[i] for i in indices], ([row[i] for i in indices] for row in rows)
+
+
+def read_rows(data_file_path, num_rows=-1, offset=0, index_path=None, fields=None, field_names=None):
+    '''
+    Read the header and a window of rows from a csv file
+
+    - num_rows is the maximum number of rows to return, -1 returns every row
+    - the other parameters are passed through to open_rows
+    '''
+    with open_rows(
+        data_file_path,
+        offset=offset,
+        index_path=index_path,
+        fields=fields,
+        field_names=field_names,
+    ) as (header, rows):
+        if num_rows >= 0:
+            rows = itertools.islice(rows, num_rows)
+        return header, list(rows)
+
+
+def iter_rows(data_file_path, offset=0, index_path=None, batch_size=None, fields=None, field_names=None):
+    '''
+    Lazily yield the header of a csv file and then its rows
+
+    If batch_size is set the rows are yielded as lists of at most batch_size rows.
+    The other parameters are passed through to open_rows
+    '''
+    with open_rows(
+        data_file_path,
+        offset=offset,
+        index_path=index_path,
+        fields=fields,
+        field_names=field_names,
+    ) as (header, rows):
+        yield header
+        if batch_size:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                yield batch
+        else:
+            yield from rows
+
+
+def get_resource_files(data_folder, datapackage=None, resources=None):
+    '''
+    Map the name of the resources dumped into data_folder to the path of their
+    file and their descriptor in datapackage.json (None if there isn't one)
+
+    The files are located through the resource paths of the datapackage when
+    it is passed in, otherwise data_folder is walked. If resources is passed in
+    only the resources whose name is in it are returned
+    '''
+    resource_files = {}
+    descriptors = (datapackage or {}).get('resources') or []
+    if descriptors and all('path' in descriptor for descriptor in descriptors):
+        for descriptor in descriptors:
+            resource_name = os.path.splitext(os.path.basename(descriptor['path']))[0]
+            if resources is not None and resource_name not in resources \
+                    and descriptor.get('name') not in resources:
+                continue
+            data_file_path = find_file(os.path.join(data_folder, descriptor['path']))
+            if data_file_path is not None:
+                resource_files[resource_name] = (data_file_path, descriptor)
+        return resource_files
+
+    for root, dirs, files in os.walk(data_folder):
+        for fname in files:
+            if fname == 'datapackage.json':
+                continue
+            resource_name, ext = os.path.splitext(strip_suffix(fname))
+            if resources is not None and resource_name not in resources:
+                continue
+            resource_files[resource_name] = (os.path.join(root, fname), None)
+    return resource_files
+
+
+def load_datapackage(data_folder):
+    '''
+    Load the datapackage.json dumped into data_folder, {} if there isn't one
+    '''
+    datapackage_file = os.path.join(data_folder, 'datapackage.json')
+    if not os.path.exists(datapackage_file):
+        return {}
+    with open(datapackage_file) as f:
+        return json.load(f)
+
+
+def get_field_names(descriptor):
+    '''
+    Get the field names of a resource from its descriptor in datapackage.json
+    '''
+    if descriptor is None or 'schema' not in descriptor:
+        return None
+    return [field['name'] for field in descriptor['schema'].get('fields', [])]
+
+
+def is_csv(data_file_path):
+    return strip_suffix(data_file_path).endswith('.csv')
+
+
+def get_index_path(data_folder, index_folder, data_file_path):
+    '''
+    Get the path of the row offset index of a file in data_folder
+    '''
+    return os.path.join(
+        index_folder,
+        f'{os.path.relpath(data_file_path, data_folder)}.index.json',
+    )
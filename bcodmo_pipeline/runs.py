@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+_runs = {}
+_runs_lock = threading.Lock()
+
+
+class PipelineRun:
+    '''
+    In-process state of a pipeline run, shared between the thread supervising
+    the dpp process and the rest of the library
+
+    - wake is set as soon as the dpp process exits or the run is cancelled,
+      so the supervising thread never has to poll the process
+    - cancelled is set when the run should be stopped
+    - started is set once the dpp process has been spawned, or once the
+      thread has given up on spawning it
+    - finishing is set once the dpp process is over (or was never spawned),
+      while the results it left behind are being compressed, summarized and stored
+    - finished is set when the supervising thread is done with the run, the
+      results are ready by then
+    - ticket is the slot of the run in the scheduler
+    - created is when the run was registered
+    - pipeline_ids has the dpp pipeline id of every pipeline run by the
+      process by cache_id, more than one for a batch
+    - limits is the RunLimits of the run
+    '''
+    def __init__(self, cache_id, wake=None, pipeline_ids=None):
+        self.cache_id = cache_id
+        self.pipeline_ids = pipeline_ids or {}
+        self.limits = None
+        self.created = time.time()
+        self.process = None
+        self.ticket = None
+        self.wake = wake if wake is not None else threading.Event()
+        self.cancelled = threading.Event()
+        self.started = threading.Event()
+        self.finishing = threading.Event()
+        self.finished = threading.Event()
+
+    def watch(self, process):
+        '''
+        Start a thread that sets wake once process has exited
+        '''
+        self.process = process
+        threading.Thread(target=self._wait, args=(process,), daemon=True).start()
+
+    def _wait(self, process):
+        process.wait()
+        self.wake.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.wake.set()
+
+    def finish(self):
+        # Release anyone still waiting for the start, the process may never have been spawned
+        self.started.set()
+        self.finishing.set()
+        self.finished.set()
+
+
+class AsyncWake:
+    '''
+    Stands in for the wake event of a run supervised by an event loop
+
+    set can be called from any thread, like threading.Event.set, and wakes up
+    the coroutine waiting in wait. It must be created inside the event loop
+    '''
+    def __init__(self):
+        self._loop = asyncio.get_event_loop()
+        self._thread_id = threading.get_ident()
+        self._event = asyncio.Event()
+
+    def set(self):
+        if threading.get_ident() == self._thread_id:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    def clear(self):
+        self._event.clear()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    async def wait(self, timeout=None):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._event.is_set()
+
+
+def register_run(cache_id, wake=None, pipeline_ids=None):
+    run = PipelineRun(cache_id, wake, pipeline_ids)
+    with _runs_lock:
+        _runs[cache_id] = run
+    return run
+
+
+def unregister_run(run):
+    with _runs_lock:
+        if _runs.get(run.cache_id) is run:
+            del _runs[run.cache_id]
+
+
+def get_run(cache_id):
+    with _runs_lock:
+        return _runs.get(cache_id)
+
+
+def find_run(cache_id):
+    '''
+    Get the run of cache_id, or the run of the batch that cache_id is part of
+    '''
+    with _runs_lock:
+        run = _runs.get(cache_id)
+        if run is None:
+            run = next((r for r in _runs.values() if cache_id in r.pipeline_ids), None)
+        return run
+
+
+def cancel_run(cache_id):
+    '''
+    Wake up the thread supervising the run of cache_id so that it stops it
+
+    Returns False if there is no run for cache_id in this process
+    '''
+    run = get_run(cache_id)
+    if run is None:
+        return False
+    run.cancel()
+    return True
@@ -0,0 +1,109 @@
+import bisect
+import itertools
+import os
+import threading
+
+# Maximum number of dpp processes running at once on this host
+MAX_RUNS = int(os.environ.get('BCODMO_PIPELINE_MAX_RUNS', os.cpu_count() or 4))
+# Maximum number of dpp processes running at once for a single version, 0 for no limit
+MAX_RUNS_PER_VERSION = int(os.environ.get('BCODMO_PIPELINE_MAX_RUNS_PER_VERSION', 0))
+# Runs submitted while this many runs are already waiting are rejected
+MAX_QUEUED_RUNS = int(os.environ.get('BCODMO_PIPELINE_MAX_QUEUED_RUNS', 100))
+
+# Lower priorities run first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class Ticket:
+    '''
+    A run waiting for, or holding, a slot in the scheduler
+
+    admitted is set once the run holds a slot, at which point wake (if
+    passed in) is set as well so a thread can wait on a single event
+    '''
+    def __init__(self, cache_id, version, priority, seq, wake=None):
+        self.cache_id = cache_id
+        self.version = version
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.admitted = threading.Event()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RunScheduler:
+    '''
+    Caps the number of concurrent dpp runs and queues the others by priority,
+    first come first served within a priority
+    '''
+    def __init__(self, max_runs=MAX_RUNS, max_runs_per_version=MAX_RUNS_PER_VERSION, max_queued=MAX_QUEUED_RUNS):
+        self.max_runs = max_runs
+        self.max_runs_per_version = max_runs_per_version
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._queue = []
+        self._running = set()
+        self._running_per_version = {}
+
+    def submit(self, cache_id, version, priority=PRIORITY_INTERACTIVE, wake=None):
+        '''
+        Queue a run, admitting it right away if there is a free slot
+
+        Returns None if the run would have to wait while the queue is full
+        '''
+        with self._lock:
+            ticket = Ticket(cache_id, version, priority, next(self._seq), wake=wake)
+            bisect.insort(self._queue, ticket)
+            self._dispatch()
+            # The queue may be full of runs of versions that are at their cap, a run
+            # that got a slot right away never counts against it
+            if not ticket.admitted.is_set() and len(self._queue) > self.max_queued:
+                self._queue.remove(ticket)
+                return None
+        return ticket
+
+    def release(self, ticket):
+        '''
+        Free the slot held by a ticket, or remove it from the queue if it is still waiting
+        '''
+        with self._lock:
+            if ticket in self._running:
+                self._running.remove(ticket)
+                self._running_per_version[ticket.version] -= 1
+            elif ticket in self._queue:
+                self._queue.remove(ticket)
+            self._dispatch()
+
+    def position(self, cache_id):
+        '''
+        Get the 1-based position of the run of cache_id in the queue, None if it isn't queued
+        '''
+        with self._lock:
+            for i, ticket in enumerate(self._queue):
+                if ticket.cache_id == cache_id:
+                    return i + 1
+        return None
+
+    def _dispatch(self):
+        # Must be called with the lock held
+        i = 0
+        while i < len(self._queue) and len(self._running) < self.max_runs:
+            ticket = self._queue[i]
+            running_version = self._running_per_version.get(ticket.version, 0)
+            if self.max_runs_per_version and running_version >= self.max_runs_per_version:
+                # Let runs of other versions go ahead
+                i += 1
+                continue
+            del self._queue[i]
+            self._running.add(ticket)
+            self._running_per_version[ticket.version] = running_version + 1
+            ticket.admitted.set()
+            if ticket.wake is not None:
+                ticket.wake.set()
+
+
+scheduler = RunScheduler()
@@ -0,0 +1,51 @@
+import yaml
+
+# Use the libyaml bindings when PyYAML was built with them, they are an order of magnitude faster
+try:
+    from yaml import CSafeDumper as SpecDumper
+    from yaml import CSafeLoader as SpecLoader
+except ImportError:
+    from yaml import SafeDumper as SpecDumper
+    from yaml import SafeLoader as SpecLoader
+
+# Key of the placeholder mapping a step is dumped in, so its lines are indented as in a whole spec
+_STEP_PLACEHOLDER = 'x'
+
+
+def dump_yaml(obj):
+    return yaml.dump(obj, Dumper=SpecDumper, sort_keys=False)
+
+
+def load_yaml(stream):
+    return yaml.load(stream, Loader=SpecLoader)
+
+
+def dump_header(name, title, description, version):
+    '''
+    Dump everything in a pipeline-spec.yaml before the list of steps
+    '''
+    return dump_yaml({
+        name: {
+            'title': title,
+            'description': description,
+            'version': version,
+        }
+    })
+
+
+def dump_step(step):
+    '''
+    Dump a single step exactly as it appears in the list of steps of a whole spec
+    '''
+    dumped = dump_yaml({_STEP_PLACEHOLDER: {'pipeline': [step]}})
+    # Drop the placeholder and pipeline keys, the two first lines
+    return dumped.split('\n', 2)[2]
+
+
+def join_spec(header, step_yamls):
+    '''
+    Put a pipeline-spec.yaml together from its dumped header and steps
+    '''
+    if not step_yamls:
+        return header + '  pipeline: []\n'
+    return ''.join([header, '  pipeline:\n'] + step_yamls)
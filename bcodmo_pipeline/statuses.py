@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+
+from datapackage_pipelines.status import status_mgr
+
+# Seconds a status read by get_pipeline_statuses is reused for, 0 disables the cache
+STATUS_CACHE_TTL = float(os.environ.get('BCODMO_PIPELINE_STATUS_CACHE_TTL', 0))
+# dpp states of a pipeline whose last execution is over, or that can't be run at all
+FINISHED_STATES = {'SUCCEEDED', 'FAILED', 'INVALID'}
+
+
+def read_status(pipeline_status):
+    '''
+    Get the fields of the last execution of a pipeline from its dpp status
+    '''
+    start_time = None
+    finish_time = None
+    pipeline_id = None
+    status = None
+    success = None
+    error_log = None
+
+    if pipeline_status and pipeline_status.last_execution:
+        last_execution = pipeline_status.last_execution
+        start_time = last_execution.start_time
+        pipeline_id = last_execution.pipeline_id
+        finish_time = last_execution.finish_time
+        success = last_execution.success
+        error_log = last_execution.error_log
+        status = pipeline_status.state()
+
+    return {
+        'start_time': start_time,
+        'finish_time': finish_time,
+        'pipeline_id': pipeline_id,
+        'status': status,
+        'error_log': error_log,
+        'success': success,
+    }
+
+
+class StatusBackend:
+    '''
+    Long-lived handle on the dpp status backend of a root folder
+
+    The backend is initialized once, on first use, instead of on every lookup.
+    Statuses read with a ttl are kept for that many seconds, the status of a
+    pipeline is dropped from the cache whenever this process changes it
+    '''
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self._status = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get_manager(self):
+        with self._lock:
+            if self._status is None:
+                status = status_mgr(self.root_dir)
+                status.initialize()
+                self._status = status
+            return self._status
+
+    def get(self, pipeline_id):
+        return self.get_manager().get(pipeline_id)
+
+    def read(self, pipeline_ids, ttl=0):
+        '''
+        Read the status of every pipeline in a single pass over the backend
+
+        Returns a dictionary of the fields of read_status by pipeline id
+        '''
+        now = time.time()
+        statuses = {}
+        missing = []
+        with self._lock:
+            for pipeline_id in pipeline_ids:
+                cached = self._cache.get(pipeline_id)
+                if ttl > 0 and cached is not None and now - cached[0] < ttl:
+                    statuses[pipeline_id] = dict(cached[1])
+                else:
+                    missing.append(pipeline_id)
+
+        if missing:
+            status = self.get_manager()
+            read = {pipeline_id: read_status(status.get(pipeline_id)) for pipeline_id in missing}
+            statuses.update({pipeline_id: dict(fields) for pipeline_id, fields in read.items()})
+            if ttl > 0:
+                with self._lock:
+                    # Drop what expired so the cache only holds recently read statuses
+                    for pipeline_id in [p for p, (read_time, _) in self._cache.items() if now - read_time >= ttl]:
+                        del self._cache[pipeline_id]
+                    for pipeline_id, fields in read.items():
+                        self._cache[pipeline_id] = (now, fields)
+        return statuses
+
+    def invalidate(self, pipeline_id):
+        with self._lock:
+            self._cache.pop(pipeline_id, None)
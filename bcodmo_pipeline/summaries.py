@@ -0,0 +1,98 @@
+import csv
+import json
+import os
+
+from .compression import open_text
+from .results import get_field_names, get_resource_files, is_csv, load_datapackage
+
+# Number of rows from the top of each resource kept in its summary
+SUMMARY_ROWS = int(os.environ.get('BCODMO_PIPELINE_SUMMARY_ROWS', 100))
+
+# Table schema field types whose min and max are compared as numbers, the others are compared as strings
+NUMERIC_TYPES = {
+    'integer': int,
+    'year': int,
+    'number': float,
+}
+
+
+def summarize_resource(data_file_path, descriptor, num_rows=SUMMARY_ROWS):
+    '''
+    Scan a csv file once and summarize it: row count, byte size, the first num_rows
+    rows and the number of missing values, min and max of every column
+    '''
+    schema = (descriptor or {}).get('schema') or {}
+    missing_values = set(schema.get('missingValues', ['']))
+    field_types = {field['name']: field.get('type') for field in schema.get('fields', [])}
+
+    with open_text(data_file_path) as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        field_names = get_field_names(descriptor) or header
+        parsers = [NUMERIC_TYPES.get(field_types.get(name)) for name in field_names]
+        null_counts = [0] * len(field_names)
+        minimums = [None] * len(field_names)
+        maximums = [None] * len(field_names)
+        rows = []
+        row_count = 0
+        for row in reader:
+            if row_count < num_rows:
+                rows.append(row)
+            row_count += 1
+            for i, value in enumerate(row[:len(field_names)]):
+                if value in missing_values:
+                    null_counts[i] += 1
+                    continue
+                if parsers[i] is not None:
+                    try:
+                        value = parsers[i](value)
+                    except ValueError:
+                        continue
+                if minimums[i] is None or value < minimums[i]:
+                    minimums[i] = value
+                if maximums[i] is None or value > maximums[i]:
+                    maximums[i] = value
+
+    return {
+        'row_count': row_count,
+        'bytes': os.path.getsize(data_file_path),
+        'header': header,
+        'rows': rows,
+        'fields': {
+            name: {
+                'null_count': null_counts[i],
+                'min': minimums[i],
+                'max': maximums[i],
+            }
+            for i, name in enumerate(field_names)
+        },
+    }
+
+
+def write_summary(data_folder, summary_path):
+    '''
+    Summarize every csv resource dumped into data_folder and write the summaries to summary_path
+    '''
+    datapackage = load_datapackage(data_folder)
+    summary = {}
+    for resource_name, (data_file_path, descriptor) in get_resource_files(data_folder, datapackage).items():
+        if not is_csv(data_file_path):
+            continue
+        summary[resource_name] = summarize_resource(data_file_path, descriptor)
+
+    # Write to a temporary file first so concurrent readers never see a partial summary
+    tmp_path = f'{summary_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f)
+    os.replace(tmp_path, summary_path)
+    return summary
+
+
+def load_summary(summary_path):
+    '''
+    Load the summaries written by write_summary, None if there are none
+    '''
+    if not os.path.exists(summary_path):
+        return None
+    with open(summary_path) as f:
+        return json.load(f)
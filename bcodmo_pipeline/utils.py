@@ -0,0 +1,87 @@
+import os
+import shutil
+import time
+
+
+def dir_size(path, seen=None):
+    '''
+    Get the total size in bytes of the files under path
+
+    Files hard linked to each other are counted once. seen is the set of
+    (device, inode) pairs already counted, share it between calls to count
+    the files linked across several folders once as well
+    '''
+    if seen is None:
+        seen = set()
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for fname in files:
+            try:
+                st = os.lstat(os.path.join(root, fname))
+            except OSError:
+                continue
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
+
+
+def evict_lru(store_dir, max_age, max_bytes, skip=None, last_used=None, ignore=None):
+    '''
+    Delete the entries of store_dir that are older than max_age seconds, then
+    delete the least recently used entries until the store fits in max_bytes
+
+    - skip is called with the name of every entry, entries it returns True for
+      are never deleted but still count towards max_bytes
+    - ignore is called with the name of every entry, entries it returns True for
+      are neither deleted nor counted towards max_bytes
+    - last_used is called with the path of every entry and returns the time it
+      was last used. By default that is the mtime of the entry, which callers
+      update (os.utime) when they use it
+
+    Returns the names of the entries that were removed and the number of bytes freed
+    '''
+    if not os.path.exists(store_dir):
+        return [], 0
+    if last_used is None:
+        last_used = os.path.getmtime
+    cur_time = time.time()
+    entries = []
+    kept_bytes = 0
+    seen = set()
+    for entry_name in os.listdir(store_dir):
+        if ignore is not None and ignore(entry_name):
+            continue
+        path = os.path.join(store_dir, entry_name)
+        try:
+            if skip is not None and skip(entry_name):
+                kept_bytes += dir_size(path, seen)
+                continue
+            entries.append((last_used(path), dir_size(path, seen), entry_name))
+        except OSError:
+            pass
+    # Least recently used first
+    entries.sort()
+
+    removed = []
+    removed_bytes = 0
+    kept = []
+    for used, size, entry_name in entries:
+        if cur_time - used > max_age:
+            shutil.rmtree(os.path.join(store_dir, entry_name), ignore_errors=True)
+            removed.append(entry_name)
+            removed_bytes += size
+        else:
+            kept.append((size, entry_name))
+
+    total = kept_bytes + sum(size for size, entry_name in kept)
+    for size, entry_name in kept:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(os.path.join(store_dir, entry_name), ignore_errors=True)
+        removed.append(entry_name)
+        removed_bytes += size
+        total -= size
+    return removed, removed_bytes
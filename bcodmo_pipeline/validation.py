@@ -0,0 +1,113 @@
+import difflib
+import json
+import logging
+import os
+import threading
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+from .environments import get_environment
+
+logger = logging.getLogger(__name__)
+
+# A processor's parameters are validated against <processor>.schema.json when the file sits next to it
+SCHEMA_SUFFIX = '.schema.json'
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+class ProcessorCatalog:
+    '''
+    The processors available to a processor version, with the compiled
+    validators of the parameters of those that ship a schema
+
+    Processors are named the way dpp resolves them: the path of their file
+    relative to a processor folder, with dots instead of slashes. dpp also
+    resolves processors from plugins, so a name is only reported as unknown
+    when its namespace (everything before the last dot) is one of the scanned folders
+    '''
+    def __init__(self, processor_paths):
+        self.processors = set()
+        self.namespaces = set()
+        self.validators = {}
+        for processor_path in processor_paths:
+            self._scan(processor_path)
+
+    def _scan(self, processor_path):
+        for root, dirs, files in os.walk(processor_path):
+            dirs[:] = [d for d in dirs if not d.startswith(('.', '_'))]
+            prefix = os.path.relpath(root, processor_path).replace(os.sep, '.')
+            prefix = '' if prefix == '.' else f'{prefix}.'
+            for fname in files:
+                if fname.endswith('.py') and not fname.startswith('_'):
+                    self.processors.add(prefix + fname[:-len('.py')])
+                    self.namespaces.add(prefix[:-1])
+                elif fname.endswith(SCHEMA_SUFFIX) and jsonschema is not None:
+                    name = prefix + fname[:-len(SCHEMA_SUFFIX)]
+                    try:
+                        with open(os.path.join(root, fname)) as f:
+                            schema = json.load(f)
+                        validator_class = jsonschema.validators.validator_for(schema)
+                        validator_class.check_schema(schema)
+                        self.validators[name] = validator_class(schema)
+                    except Exception as e:
+                        logger.error(f'Could not load the parameter schema of {name}: {str(e)}')
+
+    def validate_step(self, step):
+        '''
+        Get the errors of a single step, an empty list if it is valid
+        '''
+        if type(step) != dict:
+            return ['Object must be a dictionary']
+        if 'run' not in step:
+            return [f'"run" must be a key of the step object: {list(step.keys())}']
+        name = step['run']
+        if not isinstance(name, str):
+            return [f'"run" must be a string: {name}']
+        namespace = name.rsplit('.', 1)[0] if '.' in name else ''
+        if namespace in self.namespaces and name not in self.processors:
+            error = f'Unknown processor "{name}"'
+            matches = difflib.get_close_matches(name, self.processors, n=1)
+            if matches:
+                error += f', did you mean "{matches[0]}"?'
+            return [error]
+        validator = self.validators.get(name)
+        if validator is None:
+            return []
+        return [
+            f'Invalid parameters for {name}: {error.message}'
+            + (f' (at {"/".join(str(p) for p in error.absolute_path)})' if error.absolute_path else '')
+            for error in sorted(validator.iter_errors(step.get('parameters') or {}), key=str)
+        ]
+
+
+def get_catalog(version):
+    '''
+    Get the processor catalog of a version, it is only built on first use
+    '''
+    with _catalogs_lock:
+        if version not in _catalogs:
+            environment = get_environment(version)
+            _catalogs[version] = ProcessorCatalog([
+                environment.processor_path,
+                environment.standard_processor_path,
+            ])
+        return _catalogs[version]
+
+
+def validate_steps(version, steps, start=0):
+    '''
+    Validate a list of steps against the processors of a version in one pass
+
+    Returns every error found, prefixed by the index of its step (counting from start)
+    '''
+    catalog = get_catalog(version)
+    errors = []
+    for i, step in enumerate(steps, start):
+        for error in catalog.validate_step(step):
+            errors.append(f'Step {i}: {error}')
+    return errors
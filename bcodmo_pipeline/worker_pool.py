@@ -0,0 +1,232 @@
+import itertools
+import json
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'dpp_worker.py')
+
+# Number of warm workers kept per processor version, 0 disables the pool
+WORKERS_PER_VERSION = int(os.environ.get('BCODMO_PIPELINE_WORKERS_PER_VERSION', 0))
+# A worker is replaced after starting this many jobs
+WORKER_MAX_JOBS = int(os.environ.get('BCODMO_PIPELINE_WORKER_MAX_JOBS', 50))
+# A worker is replaced once its resident memory grows past this many bytes
+WORKER_MAX_RSS = int(os.environ.get('BCODMO_PIPELINE_WORKER_MAX_RSS', 512 * 1024 ** 2))
+# Seconds to wait for a worker to finish its imports, or to fork a job, before giving up on it
+WORKER_START_TIMEOUT = 10
+
+
+class WorkerJob:
+    '''
+    Handle on a dpp run forked by a worker, with the parts of the
+    subprocess.Popen interface used to supervise a run
+    '''
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.pid = None
+        self.returncode = None
+        self._forked = threading.Event()
+        self._exited = threading.Event()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        self._exited.wait(timeout)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.returncode is None and self.pid is not None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class Worker:
+    '''
+    A warm dpp_worker.py process running with the python of a processor version
+
+    ready is set once the worker has imported the processor stack, or once it died
+    '''
+    def __init__(self, python_path, env):
+        self.process = subprocess.Popen(
+            [python_path, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env,
+        )
+        self.jobs_started = 0
+        self.retired = False
+        self.ready = threading.Event()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def alive(self):
+        return not self.retired and self.process.poll() is None
+
+    def active_jobs(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def rss(self):
+        try:
+            return psutil.Process(self.process.pid).memory_info().rss
+        except psutil.Error:
+            return 0
+
+    def submit(self, job_id, args, cwd, env):
+        job = WorkerJob(job_id)
+        with self._lock:
+            self._jobs[job_id] = job
+            self.jobs_started += 1
+            line = json.dumps({'job': job_id, 'args': args, 'cwd': cwd, 'env': env}) + '\n'
+            self.process.stdin.write(line.encode('utf-8'))
+            self.process.stdin.flush()
+        if not job._forked.wait(WORKER_START_TIMEOUT) or job.pid is None:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            # The caller falls back to a dpp process of its own, the worker must never run the job as well
+            self._send({'cancel': job_id})
+            self.retire()
+            raise Exception('The dpp worker did not start the job')
+        return job
+
+    def _send(self, message):
+        try:
+            with self._lock:
+                self.process.stdin.write((json.dumps(message) + '\n').encode('utf-8'))
+                self.process.stdin.flush()
+        except (OSError, ValueError):
+            # The worker is gone or its stdin is already closed
+            pass
+
+    def retire(self):
+        '''
+        Stop sending jobs to the worker, it exits once its running jobs are done
+        '''
+        self.retired = True
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+    def _read(self):
+        for line in self.process.stdout:
+            message = json.loads(line.decode('utf-8'))
+            if 'ready' in message:
+                self.ready.set()
+                continue
+            with self._lock:
+                job = self._jobs.get(message['job'])
+                if job is None:
+                    continue
+                if 'pid' in message:
+                    job.pid = message['pid']
+                    job._forked.set()
+                elif 'exit' in message:
+                    job.returncode = message['exit']
+                    del self._jobs[message['job']]
+                    job._exited.set()
+
+        # The worker died, its remaining jobs can't be tracked anymore
+        self.retired = True
+        self.ready.set()
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            if job.returncode is None:
+                job.returncode = -signal.SIGKILL
+            job._forked.set()
+            job._exited.set()
+
+
+class WorkerPool:
+    '''
+    Warm workers for every processor version, keyed by the python that runs them
+    '''
+    def __init__(self, size=WORKERS_PER_VERSION):
+        self.size = size
+        self._workers = {}
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def warm(self, python_path, env):
+        '''
+        Start the missing workers of python_path, so they are ready by the time a job comes in
+        '''
+        with self._lock:
+            return self._get_workers(python_path, env)
+
+    def spawn(self, python_path, env, args, cwd, job_env=None):
+        '''
+        Run `dpp <args>` in cwd through a warm worker of python_path
+
+        Jobs are only sent to workers that are done with their imports. If none of them
+        is ready within WORKER_START_TIMEOUT nothing is sent and an exception is raised,
+        so the caller can start dpp itself
+
+        Returns a Popen-like WorkerJob
+        '''
+        deadline = time.time() + WORKER_START_TIMEOUT
+        while True:
+            with self._lock:
+                workers = self._get_workers(python_path, env)
+                ready = [w for w in workers if w.ready.is_set()]
+                if ready:
+                    worker = min(ready, key=lambda w: w.active_jobs())
+                    # Recycle the worker after this job, starting a replacement right away so it is warm
+                    # by the time the next job comes in
+                    if worker.jobs_started + 1 >= WORKER_MAX_JOBS or worker.rss() > WORKER_MAX_RSS:
+                        worker.retired = True
+                        workers.remove(worker)
+                        workers.append(Worker(python_path, env))
+                    break
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise Exception('No dpp worker of the version is ready yet')
+            # Set once the worker is ready or dead, either way the workers are looked at again
+            workers[0].ready.wait(remaining)
+
+        try:
+            return worker.submit(next(self._job_ids), args, cwd, job_env or {})
+        finally:
+            if worker.retired:
+                worker.retire()
+
+    def _get_workers(self, python_path, env):
+        workers = [w for w in self._workers.get(python_path, []) if w.alive()]
+        while len(workers) < self.size:
+            workers.append(Worker(python_path, env))
+        self._workers[python_path] = workers
+        return workers
+
+    def shutdown(self):
+        with self._lock:
+            for workers in self._workers.values():
+                for worker in workers:
+                    worker.retire()
+            self._workers.clear()
+
+
+worker_pool = WorkerPool()
@@ -0,0 +1,47 @@
+'''
+Compare two result files of run_benchmarks.py
+
+    python benchmarks/compare.py baseline.json current.json --threshold 0.1
+
+Prints the change of the median duration of every benchmark found in both files
+and exits with status 1 if any of them got slower by more than the threshold
+'''
+import argparse
+import json
+import sys
+
+
+def get_key(result):
+    return (result['benchmark'], json.dumps(result['params'], sort_keys=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = {get_key(result): result for result in json.load(f)['results']}
+    with open(args.current) as f:
+        current = {get_key(result): result for result in json.load(f)['results']}
+
+    regressions = 0
+    for key in sorted(set(baseline) & set(current)):
+        before = baseline[key]['median']
+        after = current[key]['median']
+        change = (after - before) / before if before > 0 else 0
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f'{key[0]} {key[1]}: {before:.4f}s -> {after:.4f}s ({change:+.1%}){flag}')
+
+    if regressions:
+        print(f'{regressions} benchmarks got slower by more than {args.threshold:.0%}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
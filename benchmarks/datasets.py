@@ -0,0 +1,85 @@
+import csv
+import datetime
+import json
+import os
+import random
+import shutil
+
+# Extra number columns of the wide datasets
+WIDE_EXTRA_FIELDS = 45
+
+NARROW_FIELDS = [
+    {'name': 'id', 'type': 'integer'},
+    {'name': 'station', 'type': 'string'},
+    {'name': 'lat', 'type': 'number'},
+    {'name': 'lon', 'type': 'number'},
+    {'name': 'date', 'type': 'date'},
+]
+
+
+def get_fields(shape):
+    if shape == 'narrow':
+        return list(NARROW_FIELDS)
+    if shape == 'wide':
+        return NARROW_FIELDS + [
+            {'name': f'value_{i}', 'type': 'number'} for i in range(WIDE_EXTRA_FIELDS)
+        ]
+    raise Exception(f'Unknown dataset shape "{shape}", must be one of [\'narrow\', \'wide\']')
+
+
+def generate_rows(shape, num_rows, seed=0):
+    rng = random.Random(seed)
+    start_date = datetime.date(2000, 1, 1)
+    wide = shape == 'wide'
+    for i in range(num_rows):
+        row = [
+            i,
+            f'station-{rng.randrange(1000)}',
+            f'{rng.uniform(-90, 90):.5f}',
+            f'{rng.uniform(-180, 180):.5f}',
+            (start_date + datetime.timedelta(days=rng.randrange(7000))).isoformat(),
+        ]
+        if wide:
+            row.extend(f'{rng.random():.6f}' for _ in range(WIDE_EXTRA_FIELDS))
+        yield row
+
+
+def get_dataset(data_dir, shape, num_rows):
+    '''
+    Get the path of a synthetic csv dataset, generating it the first time it is asked for
+
+    The rows only depend on shape and num_rows, so a dataset is generated once
+    and reused by every later benchmark run
+    '''
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'{shape}_{num_rows}.csv')
+    if not os.path.exists(path):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([field['name'] for field in get_fields(shape)])
+            writer.writerows(generate_rows(shape, num_rows))
+        os.replace(tmp_path, path)
+    return path
+
+
+def write_results_folder(results_folder, data_file_path, shape, resource_name='default'):
+    '''
+    Lay out a dataset the way dump_to_path does, so the readers can be
+    benchmarked without running dpp
+    '''
+    os.makedirs(results_folder, exist_ok=True)
+    target = os.path.join(results_folder, f'{resource_name}.csv')
+    try:
+        os.link(data_file_path, target)
+    except OSError:
+        shutil.copyfile(data_file_path, target)
+    with open(os.path.join(results_folder, 'datapackage.json'), 'w') as f:
+        json.dump({
+            'name': 'benchmark',
+            'resources': [{
+                'name': resource_name,
+                'path': f'{resource_name}.csv',
+                'schema': {'fields': get_fields(shape)},
+            }],
+        }, f)
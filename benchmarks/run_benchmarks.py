@@ -0,0 +1,241 @@
+'''
+Benchmarks of the run and read hot paths of bcodmo_pipeline
+
+    python benchmarks/run_benchmarks.py --sizes 1000,100000 --output results.json
+
+Every benchmark works on synthetic datasets generated in --data-dir, so nothing
+outside this repository is needed. The run benchmarks start dpp and are skipped
+with --skip-run. Compare two result files with benchmarks/compare.py
+'''
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from bcodmo_pipeline import BcodmoPipeline  # noqa: E402
+from bcodmo_pipeline.bcodmo_pipeline import ROOT_DIR  # noqa: E402
+from bcodmo_pipeline.janitor import CACHE_MAX_AGE, Janitor  # noqa: E402
+
+from datasets import get_dataset, write_results_folder  # noqa: E402
+
+BENCHMARKS_DIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_SIZES = '1000,100000,1000000'
+DEFAULT_SHAPES = 'narrow,wide'
+# num_rows asked from get_pipeline_data, -1 reads the whole resource
+READ_NUM_ROWS = [10, 100, 1000, -1]
+# Number of steps of the spec used by the parse and serialize benchmark
+SPEC_STEPS = 30
+# Number of cache folders swept by the cleanup benchmark
+SWEEP_FOLDERS = [100, 1000, 10000]
+# Seconds to wait for a background run to finish
+BACKGROUND_TIMEOUT = 3600
+
+
+def measure(fn, repeat):
+    '''
+    Call fn repeat times and return the duration of every call
+    '''
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(benchmark, durations, rows=None, **params):
+    result = {
+        'benchmark': benchmark,
+        'params': params,
+        'repeat': len(durations),
+        'min': min(durations),
+        'median': statistics.median(durations),
+        'mean': statistics.mean(durations),
+        'max': max(durations),
+    }
+    if rows is not None:
+        result['rows'] = rows
+        result['rows_per_sec'] = rows / result['median'] if result['median'] > 0 else None
+    print(f'{benchmark} {params}: median {result["median"]:.4f}s')
+    return result
+
+
+def make_pipeline(data_file_path):
+    return BcodmoPipeline(
+        name='benchmark',
+        title='Benchmark',
+        description='Synthetic benchmark pipeline',
+        version='',
+        steps=[{
+            'run': 'bcodmo_pipeline_processors.load',
+            'parameters': {
+                'name': 'default',
+                'from': data_file_path,
+                'validate': False,
+            },
+        }],
+    )
+
+
+def bench_run(data_file_path, num_rows, shape, repeat):
+    results = []
+    pipeline = make_pipeline(data_file_path)
+
+    def run():
+        cache_id = str(uuid.uuid1())
+        res = pipeline.run_pipeline(cache_id=cache_id, num_rows=0, force=True)
+        BcodmoPipeline.delete_pipeline_data(cache_id)
+        if res['status_code'] != 0:
+            raise Exception(f'The benchmark pipeline failed: {res.get("error_text")}')
+    results.append(summarize('run_pipeline', measure(run, repeat), rows=num_rows, shape=shape, num_rows=num_rows))
+
+    start_latencies = []
+    for _ in range(repeat):
+        cache_id = str(uuid.uuid1())
+        start = time.perf_counter()
+        res = pipeline.run_pipeline(cache_id=cache_id, background=True, force=True)
+        start_latencies.append(time.perf_counter() - start)
+        if res['status_code'] != 0:
+            raise Exception(f'The benchmark pipeline failed to start: {res.get("error_text")}')
+        deadline = time.time() + BACKGROUND_TIMEOUT
+        while BcodmoPipeline.get_pipeline_status(cache_id, pipeline.name)['finish_time'] is None \
+                and time.time() < deadline:
+            time.sleep(0.1)
+        BcodmoPipeline.delete_pipeline_data(cache_id)
+    results.append(summarize('background_start', start_latencies, shape=shape, num_rows=num_rows))
+    return results
+
+
+def bench_read(data_file_path, num_rows, shape, repeat):
+    '''
+    Read a results folder laid out like dump_to_path's, without running dpp
+    '''
+    results = []
+    cache_id = str(uuid.uuid1())
+    cache_folder = os.path.join(ROOT_DIR, cache_id)
+    write_results_folder(os.path.join(cache_folder, 'results'), data_file_path, shape)
+    try:
+        for read_rows in READ_NUM_ROWS:
+            if read_rows > num_rows:
+                continue
+            rows = num_rows if read_rows == -1 else read_rows
+            durations = measure(lambda: BcodmoPipeline.get_pipeline_data(cache_id, read_rows), repeat)
+            results.append(summarize(
+                'get_pipeline_data', durations, rows=rows, shape=shape, num_rows=num_rows, read_rows=read_rows,
+            ))
+
+        # The last page, served from the row offset index once it is built
+        offset = max(num_rows - 100, 0)
+        BcodmoPipeline.get_pipeline_data(cache_id, 100, offset=offset)
+        durations = measure(lambda: BcodmoPipeline.get_pipeline_data(cache_id, 100, offset=offset), repeat)
+        results.append(summarize(
+            'get_pipeline_data_offset', durations, rows=num_rows - offset, shape=shape, num_rows=num_rows, offset=offset,
+        ))
+    finally:
+        shutil.rmtree(cache_folder, ignore_errors=True)
+    return results
+
+
+def bench_spec(repeat):
+    pipeline = BcodmoPipeline(
+        name='benchmark',
+        title='Benchmark',
+        description='Synthetic benchmark pipeline',
+        version='',
+        steps=[
+            {
+                'run': 'bcodmo_pipeline_processors.rename_fields',
+                'parameters': {
+                    'resources': ['default'],
+                    'fields': [{'old_field': f'field_{i}_{j}', 'new_field': f'renamed_{i}_{j}'} for j in range(10)],
+                },
+            }
+            for i in range(SPEC_STEPS)
+        ],
+    )
+    spec = pipeline.get_yaml()
+    repeat = repeat * 10
+    return [
+        summarize('spec_parse', measure(lambda: BcodmoPipeline(pipeline_spec=spec), repeat), steps=SPEC_STEPS),
+        summarize('spec_serialize', measure(pipeline.get_yaml, repeat), steps=SPEC_STEPS),
+    ]
+
+
+def bench_sweep(repeat):
+    '''
+    Sweep a tmp folder where half of the cache folders have expired
+    '''
+    results = []
+    expired = time.time() - CACHE_MAX_AGE - 60
+    for num_folders in SWEEP_FOLDERS:
+        durations = []
+        for _ in range(repeat):
+            root_dir = tempfile.mkdtemp(prefix='bcodmo-benchmark-')
+            try:
+                for i in range(num_folders):
+                    cache_dir = os.path.join(root_dir, str(uuid.uuid1()))
+                    os.makedirs(os.path.join(cache_dir, 'results'))
+                    with open(os.path.join(cache_dir, 'results', 'default.csv'), 'w') as f:
+                        f.write('id\n1\n')
+                    with open(os.path.join(cache_dir, '.last_access'), 'w'):
+                        pass
+                    if i % 2:
+                        os.utime(os.path.join(cache_dir, '.last_access'), (expired, expired))
+                janitor = Janitor(root_dir, os.path.join(root_dir, '.checkpoints'), os.path.join(root_dir, '.memo'))
+                start = time.perf_counter()
+                janitor.sweep()
+                durations.append(time.perf_counter() - start)
+            finally:
+                shutil.rmtree(root_dir, ignore_errors=True)
+        results.append(summarize('clean_cache', durations, folders=num_folders))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the run and read hot paths of bcodmo_pipeline')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma separated numbers of rows of the datasets')
+    parser.add_argument('--shapes', default=DEFAULT_SHAPES, help='Comma separated dataset shapes: narrow, wide')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times every benchmark is repeated')
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARKS_DIR, 'data'), help='Where the datasets are generated')
+    parser.add_argument('--output', default=None, help='Path of the json results, printed if it is left out')
+    parser.add_argument('--skip-run', action='store_true', help='Skip the benchmarks that start dpp')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    shapes = args.shapes.split(',')
+
+    results = []
+    results.extend(bench_spec(args.repeat))
+    results.extend(bench_sweep(args.repeat))
+    for shape in shapes:
+        for num_rows in sizes:
+            data_file_path = get_dataset(args.data_dir, shape, num_rows)
+            results.extend(bench_read(data_file_path, num_rows, shape, args.repeat))
+            if not args.skip_run:
+                results.extend(bench_run(data_file_path, num_rows, shape, args.repeat))
+
+    report = {
+        'timestamp': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import pytest
 
@@ -18,11 +19,12 @@ class TestBcodmoPipeline():
         self.shared_data = { 'cache_id': None, 'res': None }
 
 
-    def run_pipeline(self, step_nums):
+    def run_pipeline(self, step_nums, use_checkpoints=False):
         pipeline = BcodmoPipeline(
             name=TEST_NAME,
             title=TEST_TITLE,
             description=TEST_DESCRIPTION,
+            version='',
         )
         for step_num in step_nums:
             pipeline.add_step(TEST_STEPS[step_num])
@@ -30,6 +32,7 @@ class TestBcodmoPipeline():
         res = pipeline.run_pipeline(
             cache_id=self.shared_data['cache_id'],
             verbose=True,
+            use_checkpoints=use_checkpoints,
         )
         self.shared_data['cache_id'] = res['cache_id']
         self.shared_data['res'] = res
@@ -181,5 +184,167 @@ class TestBcodmoPipeline():
         assert rows[0][1] == '3'
         assert rows[0][2] == '12'
 
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_get_pipeline_data_offset(self):
+        rows, _, res = self.run_pipeline([0])
+        r_name = res['datapackage']['resources'][0]['name']
+        page = BcodmoPipeline.get_pipeline_data(res['cache_id'], num_rows=5, offset=10)
+        assert page['resources'][r_name]['rows'] == rows[10:15]
+        page = BcodmoPipeline.get_pipeline_data(res['cache_id'], num_rows=5, offset=len(rows))
+        assert page['resources'][r_name]['rows'] == []
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_iter_pipeline_data(self):
+        rows, _, res = self.run_pipeline([0])
+        r_name = res['datapackage']['resources'][0]['name']
+        it = BcodmoPipeline.iter_pipeline_data(res['cache_id'], resource=r_name, batch_size=10)
+        assert next(it) == res['resources'][r_name]['header']
+        assert [row for batch in it for row in batch] == rows
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_get_pipeline_data_projection(self):
+        rows, fields, res = self.run_pipeline([0, 19])
+        data = BcodmoPipeline.get_pipeline_data(
+            res['cache_id'],
+            resources=['duplicate_test'],
+            fields=['Lat', 'Taxon'],
+        )
+        assert list(data['resources'].keys()) == ['duplicate_test']
+        assert data['resources']['duplicate_test']['header'] == ['Lat', 'Taxon']
+        assert data['resources']['duplicate_test']['rows'][0] == [rows[0][7], rows[0][1]]
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_checkpoint(self):
+        rows, fields, _ = self.run_pipeline([0, 5], use_checkpoints=True)
+        self.shared_data['cache_id'] = None
+        checkpoint_rows, checkpoint_fields, res = self.run_pipeline([0, 5, 6], use_checkpoints=True)
+        # The run spec starts by loading the checkpoint of [0, 5]
+        assert '.checkpoints' in BcodmoPipeline.get_pipeline_data(res['cache_id'], 0)['yaml']
+        assert checkpoint_fields == fields
+        assert len(checkpoint_rows) == len(rows)
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_memoized_results(self):
+        rows, fields, res = self.run_pipeline([0, 8])
+        first_cache_id = res['cache_id']
+        self.shared_data['cache_id'] = None
+        memo_rows, memo_fields, res = self.run_pipeline([0, 8])
+        assert res['cache_id'] != first_cache_id
+        assert memo_rows == rows
+        assert memo_fields == fields
+        status = BcodmoPipeline.get_pipeline_status(res['cache_id'], TEST_NAME)
+        assert status['success']
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_get_pipeline_summary(self):
+        rows, fields, res = self.run_pipeline([0])
+        r_name = res['datapackage']['resources'][0]['name']
+        summary = BcodmoPipeline.get_pipeline_summary(res['cache_id'])['resources'][r_name]
+        assert summary['row_count'] == len(rows)
+        assert summary['header'] == res['resources'][r_name]['header']
+        assert summary['rows'] == rows[:len(summary['rows'])]
+        assert list(summary['fields'].keys()) == [field['name'] for field in fields]
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_get_metrics(self):
+        self.run_pipeline([0])
+        metrics = BcodmoPipeline.get_metrics()
+        run_seconds = metrics['bcodmo_pipeline_run_seconds']['values'][0]
+        assert run_seconds['count'] >= 1
+        assert run_seconds['quantiles']['p50'] is not None
+        assert 'bcodmo_pipeline_runs_total{result="success"}' in BcodmoPipeline.get_metrics('prometheus')
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_validate_steps(self):
+        pipeline = BcodmoPipeline(
+            name=TEST_NAME,
+            title=TEST_TITLE,
+            description=TEST_DESCRIPTION,
+            version='',
+        )
+        pipeline.add_step(TEST_STEPS[0])
+        with pytest.raises(Exception, match='did you mean "bcodmo_pipeline_processors.load"'):
+            pipeline.add_step({**TEST_STEPS[0], 'run': 'bcodmo_pipeline_processors.lod'})
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_arun_pipeline(self):
+        rows, _, res = self.run_pipeline([0])
+        r_name = res['datapackage']['resources'][0]['name']
+        pipeline = BcodmoPipeline(
+            name=TEST_NAME,
+            title=TEST_TITLE,
+            description=TEST_DESCRIPTION,
+            version='',
+            steps=[TEST_STEPS[0]],
+        )
+        loop = asyncio.get_event_loop()
+        async_res = loop.run_until_complete(pipeline.arun_pipeline(force=True))
+        assert async_res['status_code'] == 0
+        assert async_res['resources'][r_name]['rows'] == rows
+
+        async def read_rows():
+            return [row async for row in BcodmoPipeline.aiter_pipeline_data(async_res['cache_id'], resource=r_name)]
+        assert loop.run_until_complete(read_rows())[1:] == rows
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_run_pipelines(self):
+        rows, _, res = self.run_pipeline([0])
+        r_name = res['datapackage']['resources'][0]['name']
+        pipelines = [
+            BcodmoPipeline(
+                name=f'{TEST_NAME}_{i}',
+                title=TEST_TITLE,
+                description=TEST_DESCRIPTION,
+                version='',
+                steps=[TEST_STEPS[0]],
+            )
+            for i in range(3)
+        ]
+        batch_res = BcodmoPipeline.run_pipelines(pipelines, force=True, concurrency=2)
+        assert batch_res['status_code'] == 0
+        assert len(set(r['cache_id'] for r in batch_res['pipelines'])) == 3
+        for r in batch_res['pipelines']:
+            data = BcodmoPipeline.get_pipeline_data(r['cache_id'])
+            assert data['resources'][r_name]['rows'] == rows
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_get_pipeline_statuses(self):
+        _, _, res = self.run_pipeline([0])
+        cache_id = res['cache_id']
+        statuses = BcodmoPipeline.get_pipeline_statuses([(cache_id, TEST_NAME)], ttl=60)
+        assert statuses[cache_id]['status'] == 'SUCCEEDED'
+        assert statuses[cache_id] == BcodmoPipeline.get_pipeline_status(cache_id, TEST_NAME)
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_cancel_pipeline(self):
+        pipeline = BcodmoPipeline(
+            name=TEST_NAME,
+            title=TEST_TITLE,
+            description=TEST_DESCRIPTION,
+            version='',
+            steps=[TEST_STEPS[0]],
+        )
+        res = pipeline.run_pipeline(background=True, force=True)
+        assert res['status_code'] == 0
+        assert BcodmoPipeline.cancel_pipeline(res['cache_id'])['status_code'] == 0
+        status = BcodmoPipeline.get_pipeline_status(res['cache_id'], TEST_NAME)
+        assert status['status'] == 'FAILED'
+        assert status['error_log'] == ['This pipeline was cancelled']
+
+    @pytest.mark.skipif(TEST_DEV, reason='test development')
+    def test_run_limits(self):
+        pipeline = BcodmoPipeline(
+            name=TEST_NAME,
+            title=TEST_TITLE,
+            description=TEST_DESCRIPTION,
+            version='',
+            steps=[TEST_STEPS[0]],
+        )
+        res = pipeline.run_pipeline(force=True, limits={'wall_time': 0.01})
+        assert res['status_code'] == 1
+        assert res['error_text'] == ['killed: exceeded wall-clock time limit']
+        with pytest.raises(Exception):
+            pipeline.run_pipeline(limits={'memroy': 1})
+
     def teardown_class(self):
         pass
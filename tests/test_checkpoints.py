@@ -0,0 +1,50 @@
+import os
+
+from bcodmo_pipeline.checkpoints import plan_checkpoints
+
+
+def store_checkpoint(final):
+    os.makedirs(final)
+    with open(os.path.join(final, 'datapackage.json'), 'w') as f:
+        f.write('{}')
+
+
+class TestCheckpoints():
+
+    def test_stores_only_after_the_last_step(self, tmp_path):
+        input_path = os.path.join(tmp_path, 'input.csv')
+        with open(input_path, 'w') as f:
+            f.write('id\n1\n')
+        checkpoint_dir = os.path.join(tmp_path, 'checkpoints')
+        steps = [{'run': 'load', 'parameters': {'from': input_path}}, {'run': 'step-1'}, {'run': 'step-2'}]
+
+        run_steps, step_indices, restored, pending = plan_checkpoints(checkpoint_dir, 'v1', steps, 'run-1')
+        assert [step['run'] for step in run_steps] == ['load', 'step-1', 'step-2', 'dump_to_path']
+        assert step_indices == [0, 1, 2, None]
+        assert restored == 0
+        assert len(pending) == 1
+
+        store_checkpoint(pending[0][1])
+        run_steps, step_indices, restored, pending = plan_checkpoints(
+            checkpoint_dir,
+            'v1',
+            steps + [{'run': 'step-3'}],
+            'run-2',
+        )
+        assert [step['run'] for step in run_steps] == ['load', 'step-3', 'dump_to_path']
+        assert step_indices == [None, 3, None]
+        assert restored == 3
+
+        # A forced run starts from the load step again
+        run_steps, step_indices, restored, pending = plan_checkpoints(checkpoint_dir, 'v1', steps, 'run-3', restore=False)
+        assert step_indices == [0, 1, 2, None]
+        assert restored == 0
+
+    def test_nothing_past_a_remote_input(self, tmp_path):
+        checkpoint_dir = os.path.join(tmp_path, 'checkpoints')
+        steps = [{'run': 'load', 'parameters': {'from': 'https://example.com/input.csv'}}, {'run': 'step-1'}]
+        run_steps, step_indices, restored, pending = plan_checkpoints(checkpoint_dir, 'v1', steps, 'run-1')
+        assert run_steps == steps
+        assert step_indices == [0, 1]
+        assert restored == 0
+        assert pending == []
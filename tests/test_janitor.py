@@ -0,0 +1,98 @@
+import os
+import time
+
+from bcodmo_pipeline import janitor
+from bcodmo_pipeline.janitor import ACCESS_FILE, Janitor
+from bcodmo_pipeline.runs import register_run, unregister_run
+from bcodmo_pipeline.utils import dir_size, evict_lru
+
+
+def make_entry(store_dir, name, size, age=0, access_file=None):
+    path = os.path.join(store_dir, name)
+    os.makedirs(path)
+    with open(os.path.join(path, 'data.csv'), 'wb') as f:
+        f.write(b'x' * size)
+    used = time.time() - age
+    if access_file is not None:
+        open(os.path.join(path, access_file), 'a').close()
+        os.utime(os.path.join(path, access_file), (used, used))
+    os.utime(path, (used, used))
+    return path
+
+
+class TestEvictLru():
+
+    def test_age_eviction(self, tmp_path):
+        make_entry(tmp_path, 'old', 10, age=100)
+        make_entry(tmp_path, 'new', 10, age=1)
+        removed, removed_bytes = evict_lru(tmp_path, 50, 1000)
+        assert removed == ['old']
+        assert removed_bytes == 10
+        assert sorted(os.listdir(tmp_path)) == ['new']
+
+    def test_quota_eviction_in_lru_order(self, tmp_path):
+        for name, age in [('b', 20), ('a', 30), ('c', 10), ('d', 0)]:
+            make_entry(tmp_path, name, 100, age=age)
+        removed, removed_bytes = evict_lru(tmp_path, 1000, 250)
+        assert removed == ['a', 'b']
+        assert removed_bytes == 200
+        assert sorted(os.listdir(tmp_path)) == ['c', 'd']
+
+    def test_skipped_and_ignored_entries(self, tmp_path):
+        make_entry(tmp_path, 'active', 100, age=100)
+        make_entry(tmp_path, '.store', 1000, age=100)
+        make_entry(tmp_path, 'idle', 100, age=1)
+        removed, _ = evict_lru(
+            tmp_path,
+            50,
+            150,
+            skip=lambda name: name == 'active',
+            ignore=lambda name: name.startswith('.'),
+        )
+        # The skipped entry counts towards the quota, the ignored one doesn't
+        assert removed == ['idle']
+        assert sorted(os.listdir(tmp_path)) == ['.store', 'active']
+
+    def test_hard_links_are_counted_once(self, tmp_path):
+        first = make_entry(tmp_path, 'first', 100, age=20)
+        second = os.path.join(tmp_path, 'second')
+        os.makedirs(second)
+        os.link(os.path.join(first, 'data.csv'), os.path.join(second, 'data.csv'))
+        os.link(os.path.join(first, 'data.csv'), os.path.join(second, 'copy.csv'))
+        assert dir_size(second) == 100
+        assert dir_size(tmp_path) == 100
+        removed, _ = evict_lru(tmp_path, 1000, 100)
+        assert removed == []
+
+
+class TestJanitor():
+
+    def test_sweep(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(janitor, 'CACHE_MAX_AGE', 50)
+        monkeypatch.setattr(janitor, 'CACHE_MAX_BYTES', 300)
+        root_dir = os.path.join(tmp_path, 'tmp')
+        os.makedirs(root_dir)
+        make_entry(root_dir, 'expired', 100, age=100, access_file=ACCESS_FILE)
+        make_entry(root_dir, 'running', 100, age=100, access_file=ACCESS_FILE)
+        make_entry(root_dir, 'in-batch', 100, age=100, access_file=ACCESS_FILE)
+        make_entry(root_dir, 'least-recent', 100, age=20, access_file=ACCESS_FILE)
+        make_entry(root_dir, 'recent', 100, age=10, access_file=ACCESS_FILE)
+        # The stores have their own quotas and are left out of CACHE_MAX_BYTES
+        make_entry(root_dir, '.memo', 1000, age=100)
+        make_entry(root_dir, '.checkpoints', 1000, age=100)
+
+        run = register_run('running')
+        batch = register_run('batch', pipeline_ids={'in-batch': './in-batch/test'})
+        try:
+            report = Janitor(
+                root_dir,
+                os.path.join(root_dir, '.checkpoints'),
+                os.path.join(root_dir, '.memo'),
+            ).sweep()
+        finally:
+            unregister_run(run)
+            unregister_run(batch)
+
+        # The folders of active runs count towards the quota, so the least recent folder goes too
+        assert sorted(report['removed']) == ['expired', 'least-recent']
+        assert sorted(os.listdir(root_dir)) == ['.checkpoints', '.memo', 'in-batch', 'recent', 'running']
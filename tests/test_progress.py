@@ -0,0 +1,77 @@
+import json
+import os
+
+from bcodmo_pipeline.progress import build_profile, instrument_steps, load_progress
+
+
+def write_progress(progress_folder, parameters, done):
+    with open(parameters['out-path'], 'w') as f:
+        json.dump({
+            'position': parameters['position'],
+            'step': parameters['step'],
+            'run': parameters['run'],
+            'injected': parameters['injected'],
+            'rows': {'default': 10},
+            'done': done,
+        }, f)
+
+
+class TestProgress():
+
+    def test_numbers_the_steps_of_the_pipeline(self, tmp_path):
+        progress_folder = os.path.join(tmp_path, 'progress')
+        # A run restored from a checkpoint of the first two steps, with the checkpoint dump and save steps added
+        steps = [{'run': 'load'}, {'run': 'step-2'}, {'run': 'step-3'}, {'run': 'dump_to_path'}, {'run': 'dump_to_path'}]
+        instrumented = instrument_steps(str(tmp_path), steps, progress_folder, [None, 2, 3, None, None])
+        assert [step['run'] for step in instrumented[::2]] == [step['run'] for step in steps]
+        parameters = [step['parameters'] for step in instrumented[1::2]]
+        assert [p['position'] for p in parameters] == [0, 1, 2, 3, 4]
+        assert [p['step'] for p in parameters] == [None, 2, 3, None, None]
+        assert [p['injected'] for p in parameters] == [True, False, False, True, True]
+
+        for p, done in zip(parameters, [False, False, False, False, False]):
+            write_progress(progress_folder, p, done)
+        steps, current_step = load_progress(progress_folder)
+        assert [step['position'] for step in steps] == [0, 1, 2, 3, 4]
+        # The injected load step isn't reported as the current step
+        assert current_step == 2
+
+        for p, done in zip(parameters, [True, True, True, False, False]):
+            write_progress(progress_folder, p, done)
+        _, current_step = load_progress(progress_folder)
+        assert current_step is None
+
+    def test_profile_marks_restored_and_injected_steps(self, tmp_path):
+        progress_folder = os.path.join(tmp_path, 'progress')
+        pipeline_steps = [{'run': 'load'}, {'run': 'step-1'}, {'run': 'step-2'}]
+        steps = [{'run': 'load'}, {'run': 'step-2'}, {'run': 'dump_to_path'}]
+        instrumented = instrument_steps(str(tmp_path), steps, progress_folder, [None, 2, None], pipeline_steps[:2])
+        for position, step in enumerate(instrumented[1::2]):
+            p = step['parameters']
+            with open(p['out-path'], 'w') as f:
+                json.dump({
+                    'position': p['position'],
+                    'step': p['step'],
+                    'run': p['run'],
+                    'injected': p['injected'],
+                    'restored': p.get('restored', []),
+                    'rows': {'default': 10},
+                    'done': True,
+                    'start_time': 0,
+                    'first_row_time': position,
+                    'finish_time': position + 1,
+                    'update_time': position + 1,
+                }, f)
+
+        profile = build_profile(progress_folder)
+        assert [(entry['step'], entry['run']) for entry in profile] == [
+            (0, 'load'),
+            (1, 'step-1'),
+            (None, 'load'),
+            (2, 'step-2'),
+            (None, 'dump_to_path'),
+        ]
+        assert [entry['restored'] for entry in profile] == [True, True, False, False, False]
+        assert [entry['injected'] for entry in profile] == [False, False, True, False, True]
+        assert profile[3]['wall_time'] == 1
+        assert profile[3]['rows_in'] == 10
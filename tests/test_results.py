@@ -0,0 +1,101 @@
+import csv
+import gzip
+import os
+
+import pytest
+
+from bcodmo_pipeline import results
+from bcodmo_pipeline.compression import compress_file
+from bcodmo_pipeline.results import build_row_index, iter_rows, load_row_index, read_rows
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+@pytest.fixture
+def stride(monkeypatch):
+    # A small stride so a few rows cross several index entries
+    monkeypatch.setattr(results, 'INDEX_STRIDE', 4)
+    return 4
+
+
+class TestResults():
+
+    def test_build_row_index(self, tmp_path, stride):
+        path = os.path.join(tmp_path, 'default.csv')
+        rows = [[str(i), f'value {i}'] for i in range(10)]
+        write_csv(path, ['id', 'value'], rows)
+        index = build_row_index(path)
+        assert index['row_count'] == 10
+        assert index['stride'] == stride
+        assert len(index['offsets']) == 3
+        with open(path, 'rb') as f:
+            for block, offset in enumerate(index['offsets']):
+                f.seek(offset)
+                assert f.readline().decode('utf-8').startswith(f'{block * stride},')
+
+    def test_row_index_is_rebuilt_when_the_file_changes(self, tmp_path, stride):
+        path = os.path.join(tmp_path, 'default.csv')
+        index_path = os.path.join(tmp_path, 'index', 'default.csv.index.json')
+        write_csv(path, ['id'], [[str(i)] for i in range(5)])
+        assert load_row_index(path, index_path)['row_count'] == 5
+        assert os.path.exists(index_path)
+
+        write_csv(path, ['id'], [[str(i)] for i in range(9)])
+        assert load_row_index(path, index_path)['row_count'] == 9
+
+    def test_offset_across_stride_boundaries(self, tmp_path, stride):
+        path = os.path.join(tmp_path, 'default.csv')
+        index_path = os.path.join(tmp_path, 'index', 'default.csv.index.json')
+        rows = [[str(i), f'value {i}'] for i in range(10)]
+        write_csv(path, ['id', 'value'], rows)
+        for offset in range(12):
+            for num_rows in [-1, 0, 1, 3, 5]:
+                header, window = read_rows(path, num_rows=num_rows, offset=offset, index_path=index_path)
+                assert header == ['id', 'value']
+                expected = rows[offset:] if num_rows < 0 else rows[offset:offset + num_rows]
+                assert window == expected
+
+    def test_multi_line_quoted_cells(self, tmp_path, stride):
+        path = os.path.join(tmp_path, 'default.csv')
+        index_path = os.path.join(tmp_path, 'index', 'default.csv.index.json')
+        rows = [[str(i), f'line one\r\nline "two" of {i}'] for i in range(10)]
+        write_csv(path, ['id', 'note'], rows)
+        assert build_row_index(path)['row_count'] == 10
+        for offset in [0, 3, 4, 5, 8, 9]:
+            _, window = read_rows(path, offset=offset, index_path=index_path)
+            assert window == rows[offset:]
+
+    def test_fields_projection(self, tmp_path):
+        path = os.path.join(tmp_path, 'default.csv')
+        rows = [[str(i), f'a{i}', f'b{i}'] for i in range(3)]
+        write_csv(path, ['id', 'a', 'b'], rows)
+        header, window = read_rows(path, fields=['b', 'id'])
+        assert header == ['b', 'id']
+        assert window == [[row[2], row[0]] for row in rows]
+        with pytest.raises(Exception):
+            read_rows(path, fields=['missing'])
+
+    def test_iter_rows_of_a_compressed_file(self, tmp_path):
+        path = os.path.join(tmp_path, 'default.csv.gz')
+        rows = [[str(i)] for i in range(7)]
+        with gzip.open(path, 'wt', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id'])
+            writer.writerows(rows)
+        batches = list(iter_rows(path, offset=2, batch_size=2))
+        assert batches[0] == ['id']
+        assert batches[1:] == [rows[2:4], rows[4:6], rows[6:]]
+
+    def test_file_compressed_after_it_was_located(self, tmp_path, stride):
+        path = os.path.join(tmp_path, 'default.csv')
+        index_path = os.path.join(tmp_path, 'index', 'default.csv.index.json')
+        rows = [[str(i)] for i in range(6)]
+        write_csv(path, ['id'], rows)
+        compress_file(path, 'gzip')
+        assert read_rows(path, offset=5, index_path=index_path) == (['id'], rows[5:])
+        assert list(iter_rows(path)) == [['id']] + rows
@@ -0,0 +1,63 @@
+from bcodmo_pipeline.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RunScheduler
+
+
+class TestRunScheduler():
+
+    def test_admits_up_to_max_runs(self):
+        scheduler = RunScheduler(max_runs=2, max_runs_per_version=0, max_queued=10)
+        tickets = [scheduler.submit(f'run-{i}', 'v1') for i in range(3)]
+        assert [t.admitted.is_set() for t in tickets] == [True, True, False]
+        assert scheduler.position('run-2') == 1
+
+        scheduler.release(tickets[0])
+        assert tickets[2].admitted.is_set()
+        assert scheduler.position('run-2') is None
+
+    def test_priority_then_submission_order(self):
+        scheduler = RunScheduler(max_runs=1, max_runs_per_version=0, max_queued=10)
+        running = scheduler.submit('running', 'v1')
+        first = scheduler.submit('background-1', 'v1', PRIORITY_BACKGROUND)
+        second = scheduler.submit('background-2', 'v1', PRIORITY_BACKGROUND)
+        interactive = scheduler.submit('interactive', 'v1', PRIORITY_INTERACTIVE)
+        assert [scheduler.position(c) for c in ['interactive', 'background-1', 'background-2']] == [1, 2, 3]
+
+        admitted = []
+        for ticket in [running, interactive, first, second]:
+            scheduler.release(ticket)
+            admitted.append([t.cache_id for t in [interactive, first, second] if t.admitted.is_set()])
+        assert admitted[:3] == [
+            ['interactive'],
+            ['interactive', 'background-1'],
+            ['interactive', 'background-1', 'background-2'],
+        ]
+
+    def test_per_version_cap(self):
+        scheduler = RunScheduler(max_runs=3, max_runs_per_version=1, max_queued=10)
+        v1_first = scheduler.submit('v1-1', 'v1')
+        v1_second = scheduler.submit('v1-2', 'v1')
+        v2_first = scheduler.submit('v2-1', 'v2')
+        assert v1_first.admitted.is_set()
+        assert not v1_second.admitted.is_set()
+        # Runs of other versions go ahead of a version at its cap
+        assert v2_first.admitted.is_set()
+
+        scheduler.release(v1_first)
+        assert v1_second.admitted.is_set()
+
+    def test_rejects_when_queue_is_full(self):
+        scheduler = RunScheduler(max_runs=1, max_runs_per_version=0, max_queued=1)
+        assert scheduler.submit('running', 'v1').admitted.is_set()
+        assert scheduler.submit('queued', 'v1') is not None
+        assert scheduler.submit('rejected', 'v1') is None
+        assert scheduler.position('rejected') is None
+
+    def test_admits_other_version_when_queue_is_full(self):
+        scheduler = RunScheduler(max_runs=2, max_runs_per_version=1, max_queued=2)
+        scheduler.submit('v1-1', 'v1')
+        scheduler.submit('v1-2', 'v1')
+        scheduler.submit('v1-3', 'v1')
+        # The queue is full of runs blocked by the cap of v1, but v2 has a free slot
+        ticket = scheduler.submit('v2-1', 'v2')
+        assert ticket is not None
+        assert ticket.admitted.is_set()
+        assert scheduler.submit('v1-4', 'v1') is None